@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Watchdog benchmark on simulated network: devices are checked by the real Device / WatchManager code,
+results (cycles per second, cycle time percentiles, CPU, RSS) are written to JSON.
+
+    python bench/bench_watchdog.py --sizes 100,1000,10000
+    python bench/bench_watchdog.py --baseline bench/results/bench-<time>.json
+
+Every size is run in a new process (clean RSS, settings and singletons), simulated network
+is served by this process.
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import queue
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+# Max wait for results of one cycle, seconds
+CYCLE_TIMEOUT = 120
+# Compared with baseline (lower is better)
+COMPARED = ("cycle_p50_s", "cycle_p99_s", "cpu_percent", "rss_mb")
+
+sys.path.insert(0, REPO_DIR)
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if len(values) == 0:
+        return None
+    return values[min(len(values) - 1, int(round((len(values) - 1) * p / 100)))]
+
+
+def rss_mb():
+    """
+    :return: resident set size of this process, MB
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_child(plan_file, rounds, concurrency, processes):
+    """
+    Child process: check all devices of plan rounds times, every round all devices are due at once
+    :return: results dict
+    """
+    with open(plan_file) as f:
+        plan = json.load(f)
+    # Settings, journal and history are created in work dir
+    os.chdir(os.path.dirname(plan_file))
+    os.makedirs("res", exist_ok=True)
+    from settings import Settings, UPDATE_TIMEOUT, PROBE_CONCURRENCY, PROBE_PROCESSES
+    settings = Settings()
+    # Devices are checked only when round starts
+    settings.write(UPDATE_TIMEOUT, 3600)
+    settings.write(PROBE_CONCURRENCY, concurrency)
+    settings.write(PROBE_PROCESSES, processes)
+    from watch_manager import WatchManager, Watcher
+    from device import Device
+
+    rss_before = rss_mb()
+    WM = WatchManager()
+    results = queue.Queue()
+    WM.engine.on_result = results.put
+    devices = []
+    for config in plan:
+        device = Device(*config.values())
+        WM.add_watch(Watcher(device), rebuild=False)
+        devices.append(device)
+
+    cycles = []
+    online = 0
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    for cycle in range(rounds):
+        start = time.perf_counter()
+        if cycle == 0:
+            WM.engine.start()
+        else:
+            for device in devices:
+                WM.engine.watch(device)
+        checked = set()
+        online = 0
+        while len(checked) < len(devices):
+            try:
+                device = results.get(timeout=CYCLE_TIMEOUT)
+            except queue.Empty:
+                logging.error(f"Cycle {cycle}: {len(devices) - len(checked)} devices not checked")
+                break
+            if id(device) in checked:
+                continue
+            checked.add(id(device))
+            online += bool(device.online_stat)
+            WM.check_trigger(WM.watcher(device))
+        cycles.append(time.perf_counter() - start)
+    cpu, wall = time.process_time() - cpu_start, time.perf_counter() - wall_start
+    rss = rss_mb()
+    WM.stop()
+
+    # The first cycle includes connection setup and ONVIF info requests
+    steady = cycles[1:] or cycles
+    return {
+        "devices": len(devices),
+        "online": online,
+        "first_cycle_s": cycles[0],
+        "cycles_per_s": len(steady) / sum(steady),
+        "cycle_p50_s": percentile(steady, 50),
+        "cycle_p99_s": percentile(steady, 99),
+        "cycles_s": cycles,
+        "cpu_percent": 100 * cpu / wall,
+        "rss_mb": rss,
+        "rss_devices_mb": rss - rss_before,
+        "missed_deadlines": WM.engine.missed_deadlines,
+        "threads": threading.active_count()
+    }
+
+
+def run_size(args, size):
+    from net_sim import build_plan, SimulatedNetwork
+
+    plan = build_plan(size, onvif=args.onvif, closed=args.closed, blackhole=args.blackhole, ping=args.ping)
+    network = SimulatedNetwork(plan, onvif_delay=args.onvif_delay, onvif_failure=args.onvif_failure)
+    network.start()
+    try:
+        with tempfile.TemporaryDirectory(prefix="bench-") as work_dir:
+            plan_file = os.path.join(work_dir, "plan.json")
+            with open(plan_file, "w") as f:
+                json.dump(plan, f)
+            command = [sys.executable, os.path.abspath(__file__), "--child", plan_file,
+                       "--rounds", str(args.rounds), "--concurrency", str(args.concurrency),
+                       "--processes", str(args.processes), "--loglevel", args.loglevel]
+            process = subprocess.run(command, stdout=subprocess.PIPE, text=True)
+            if process.returncode != 0:
+                raise RuntimeError(f"{size} devices: child exited with {process.returncode}")
+            result = json.loads(process.stdout.strip().splitlines()[-1])
+    finally:
+        network.stop()
+    result["onvif_requests"] = network.requests
+    return result
+
+
+def compare(results, baseline_file, tolerance):
+    """
+    :return: list of regression descriptions (value worse than baseline by more than tolerance)
+    """
+    with open(baseline_file) as f:
+        baseline = {run["devices"]: run for run in json.load(f)["runs"]}
+    regressions = []
+    for run in results["runs"]:
+        base = baseline.get(run["devices"])
+        if base is None:
+            continue
+        for key in COMPARED:
+            if base.get(key) and run[key] > base[key] * (1 + tolerance):
+                regressions.append(f"{run['devices']} devices: {key} {run[key]:.3f} > {base[key]:.3f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Watchdog benchmark on simulated network")
+    parser.add_argument("--sizes", default="100,1000,10000", help="Devices counts, comma separated")
+    parser.add_argument("--rounds", type=int, default=5, help="Check cycles per size (the first is warm-up)")
+    parser.add_argument("--concurrency", type=int, default=64, help="probe_concurrency setting")
+    parser.add_argument("--processes", type=int, default=0, help="probe_processes setting")
+    parser.add_argument("--onvif", type=float, default=0.05, help="Share of fake ONVIF cameras")
+    parser.add_argument("--closed", type=float, default=0.05, help="Share of closed TCP ports")
+    parser.add_argument("--blackhole", type=float, default=0.0, help="Share of not answering devices (timeouts)")
+    parser.add_argument("--ping", type=float, default=0.1, help="Share of ICMP devices")
+    parser.add_argument("--onvif-delay", type=float, default=0.0, help="ONVIF response delay, seconds")
+    parser.add_argument("--onvif-failure", type=float, default=0.0, help="Share of failed ONVIF responses")
+    parser.add_argument("--output", help="Results JSON file (default: bench/results/bench-<time>.json)")
+    parser.add_argument("--baseline", help="Results JSON file to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed regression against baseline")
+    parser.add_argument("--loglevel", default="WARNING")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    logging.basicConfig(format="%(asctime)s %(name)s: %(levelname)s: %(message)s",
+                        level=getattr(logging, args.loglevel.upper(), logging.WARNING), stream=sys.stderr)
+
+    from tcp_sweep import raise_fd_limit
+    raise_fd_limit()
+    if args.child:
+        print(json.dumps(run_child(args.child, args.rounds, args.concurrency, args.processes)))
+        return 0
+
+    results = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "options": {key: value for key, value in vars(args).items() if key not in ("child", "output", "baseline")},
+        "runs": []
+    }
+    for size in (int(size) for size in args.sizes.split(",")):
+        result = run_size(args, size)
+        results["runs"].append(result)
+        print(f"{size:6d} devices: {result['cycles_per_s']:7.2f} cycles/s, p50 {result['cycle_p50_s'] * 1000:8.1f} ms, "
+              f"p99 {result['cycle_p99_s'] * 1000:8.1f} ms, first {result['first_cycle_s'] * 1000:8.1f} ms, "
+              f"CPU {result['cpu_percent']:5.1f}%, RSS {result['rss_mb']:6.1f} MB, "
+              f"online {result['online']}/{result['devices']}")
+
+    output = args.output or os.path.join(RESULTS_DIR, f"bench-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results: {output}")
+
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
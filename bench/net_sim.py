@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import logging
+import random
+import socket
+import threading
+import time
+from datetime import datetime, timezone
+
+# Devices are simulated on loopback aliases 127.<net>.x.y (Linux routes 127.0.0.0/8 to lo)
+PORT_NET = 10  # listening TCP ports
+CLOSED_NET = 11  # connection refused
+BLACKHOLE_NET = 12  # SYN dropped (connect timeout)
+ONVIF_NET = 13  # fake ONVIF cameras
+PING_NET = 14  # ICMP echo answered by kernel
+TCP_PORT = 8000
+ONVIF_PORT = 8080
+# Connections kept in accept queue of blackhole listener, next SYNs are dropped
+BLACKHOLE_FILL = 4
+
+SOAP_ENVELOPE = (
+    '<?xml version="1.0" encoding="UTF-8"?>'
+    '<s:Envelope xmlns:s="http://www.w3.org/2003/05/soap-envelope" '
+    'xmlns:tds="http://www.onvif.org/ver10/device/wsdl" xmlns:trt="http://www.onvif.org/ver10/media/wsdl" '
+    'xmlns:tt="http://www.onvif.org/ver10/schema">'
+    '<s:Body>{body}</s:Body></s:Envelope>'
+)
+SOAP_FAULT = (
+    '<s:Fault><s:Code><s:Value>s:Receiver</s:Value></s:Code>'
+    '<s:Reason><s:Text xml:lang="en">Action not supported</s:Text></s:Reason></s:Fault>'
+)
+SOAP_RESPONSES = {
+    "GetSystemDateAndTime": (
+        '<tds:GetSystemDateAndTimeResponse><tds:SystemDateAndTime>'
+        '<tt:DateTimeType>NTP</tt:DateTimeType><tt:DaylightSavings>false</tt:DaylightSavings>'
+        '<tt:UTCDateTime><tt:Time><tt:Hour>{now.hour}</tt:Hour><tt:Minute>{now.minute}</tt:Minute>'
+        '<tt:Second>{now.second}</tt:Second></tt:Time><tt:Date><tt:Year>{now.year}</tt:Year>'
+        '<tt:Month>{now.month}</tt:Month><tt:Day>{now.day}</tt:Day></tt:Date></tt:UTCDateTime>'
+        '</tds:SystemDateAndTime></tds:GetSystemDateAndTimeResponse>'
+    ),
+    "GetCapabilities": (
+        '<tds:GetCapabilitiesResponse><tds:Capabilities>'
+        '<tt:Device><tt:XAddr>http://{host}/onvif/device_service</tt:XAddr></tt:Device>'
+        '<tt:Media><tt:XAddr>http://{host}/onvif/media_service</tt:XAddr>'
+        '<tt:StreamingCapabilities><tt:RTPMulticast>false</tt:RTPMulticast><tt:RTP_TCP>true</tt:RTP_TCP>'
+        '<tt:RTP_RTSP_TCP>true</tt:RTP_RTSP_TCP></tt:StreamingCapabilities></tt:Media>'
+        '</tds:Capabilities></tds:GetCapabilitiesResponse>'
+    ),
+    "GetDeviceInformation": (
+        '<tds:GetDeviceInformationResponse><tds:Manufacturer>BENCH</tds:Manufacturer>'
+        '<tds:Model>SIM-{port}</tds:Model><tds:FirmwareVersion>V1.0.0 build 000000</tds:FirmwareVersion>'
+        '<tds:SerialNumber>SIM{host}</tds:SerialNumber><tds:HardwareId>1</tds:HardwareId>'
+        '</tds:GetDeviceInformationResponse>'
+    ),
+    "GetProfiles": (
+        '<trt:GetProfilesResponse><trt:Profiles token="profile_1" fixed="true"><tt:Name>main</tt:Name>'
+        '</trt:Profiles></trt:GetProfilesResponse>'
+    ),
+    "GetSnapshotUri": (
+        '<trt:GetSnapshotUriResponse><trt:MediaUri><tt:Uri>http://{host}/snapshot.jpg</tt:Uri>'
+        '<tt:InvalidAfterConnect>false</tt:InvalidAfterConnect><tt:InvalidAfterReboot>false'
+        '</tt:InvalidAfterReboot><tt:Timeout>PT0S</tt:Timeout></trt:MediaUri></trt:GetSnapshotUriResponse>'
+    ),
+}
+# Snapshot of every camera (8x8 gray JPEG)
+SNAPSHOT_JPEG = bytes.fromhex(
+    "ffd8ffe000104a46494600010101006400640000ffdb004300100b0c0e0c0a100e0d0e1211101318281a181616183123251d"
+    "283a333d3c3933383740485c4e404457453738506d51575f626768673e4d71797064785c656763ffdb004301111212181518"
+    "2f1a1a2f63423842636363636363636363636363636363636363636363636363636363636363636363636363636363636363"
+    "6363636363636363ffc00011080008000803012200021101031101ffc4001f00000105010101010101000000000000000001"
+    "02030405060708090a0bffc400b5100002010303020403050504040000017d01020300041105122131410613516107227114"
+    "328191a1082342b1c11552d1f02433627282090a161718191a25262728292a3435363738393a434445464748494a53545556"
+    "5758595a636465666768696a737475767778797a838485868788898a92939495969798999aa2a3a4a5a6a7a8a9aab2b3b4b5"
+    "b6b7b8b9bac2c3c4c5c6c7c8c9cad2d3d4d5d6d7d8d9dae1e2e3e4e5e6e7e8e9eaf1f2f3f4f5f6f7f8f9faffc4001f010003"
+    "0101010101010101010000000000000102030405060708090a0bffc400b51100020102040403040705040400010277000102"
+    "031104052131061241510761711322328108144291a1b1c109233352f0156272d10a162434e125f11718191a262728292a35"
+    "363738393a434445464748494a535455565758595a636465666768696a737475767778797a82838485868788898a92939495"
+    "969798999aa2a3a4a5a6a7a8a9aab2b3b4b5b6b7b8b9bac2c3c4c5c6c7c8c9cad2d3d4d5d6d7d8d9dae2e3e4e5e6e7e8e9ea"
+    "f2f3f4f5f6f7f8f9faffda000c03010002110311003f0028a28a00ffd9"
+)
+
+
+def alias(net, index):
+    """
+    :return: loopback alias of device index in net (127.net.x.y, y never 0 or 255)
+    """
+    return f"127.{net}.{index // 254}.{index % 254 + 1}"
+
+
+def build_plan(count, onvif=0.05, closed=0.05, blackhole=0.0, ping=0.1, seed=1):
+    """
+    Devices of simulated network
+    :param count: devices count
+    :param onvif, closed, blackhole, ping: shares of fake ONVIF cameras, closed ports, timeouts, ICMP;
+        the rest are open TCP ports
+    :return: list of device configs (Device.get_config() format)
+    """
+    shares = ((ONVIF_NET, onvif), (CLOSED_NET, closed), (BLACKHOLE_NET, blackhole), (PING_NET, ping))
+    plan = []
+    for net, share in shares:
+        for i in range(int(round(count * share))):
+            plan.append(_config(net, i))
+    for i in range(count - len(plan)):
+        plan.append(_config(PORT_NET, i))
+    random.Random(seed).shuffle(plan)
+    return plan[:count]
+
+
+def _config(net, index):
+    # WatchMethod values: PORT = 1, ONVIF = 2, PING = 3
+    method, port = {ONVIF_NET: (2, ONVIF_PORT), PING_NET: (3, 0)}.get(net, (1, TCP_PORT))
+    return {
+        "watch_method": str(method),
+        "watch_for": "1",
+        "ip": alias(net, index),
+        "user": "bench",
+        "password": "bench",
+        "port": str(port),
+        "watched": "True",
+        "interval": "0"
+    }
+
+
+class SimulatedNetwork:
+    """
+    Local stand-ins of devices, served by one asyncio loop in background thread:
+    TCP listeners (connections accepted and closed), fake ONVIF SOAP / snapshot HTTP servers
+    with configurable delay and failure rate, blackhole listeners with full accept queue.
+    Closed port and ICMP devices need no servers.
+    """
+
+    def __init__(self, plan, onvif_delay=0.0, onvif_failure=0.0):
+        """
+        :param plan: device configs (see build_plan)
+        :param onvif_delay: ONVIF response delay, seconds
+        :param onvif_failure: share of ONVIF requests answered by HTTP 500
+        """
+        self.logger = logging.getLogger("SimulatedNetwork")
+        self.plan = plan
+        self.onvif_delay = onvif_delay
+        self.onvif_failure = onvif_failure
+        self.loop = None
+        self.thread = None
+        self.servers = []
+        self.sockets = []  # blackhole listeners and their queued connections
+        self.requests = 0
+        self.ready = threading.Event()
+
+    def start(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run, name="SimulatedNetwork", daemon=True)
+        self.thread.start()
+        self.ready.wait()
+
+    def stop(self):
+        if self.thread is None:
+            return
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        for sock in self.sockets:
+            sock.close()
+        self.thread = None
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self._listen())
+        finally:
+            self.ready.set()
+        self.loop.run_forever()
+        for server in self.servers:
+            server.close()
+        self.loop.close()
+
+    async def _listen(self):
+        start = time.monotonic()
+        for config in self.plan:
+            host, port = config["ip"], int(config["port"])
+            net = int(host.split(".")[1])
+            try:
+                if net == PORT_NET:
+                    self.servers.append(await asyncio.start_server(self._tcp_client, host, port, backlog=128))
+                elif net == ONVIF_NET:
+                    self.servers.append(await asyncio.start_server(self._http_client, host, port, backlog=128))
+                elif net == BLACKHOLE_NET:
+                    self._blackhole(host, port)
+            except OSError as e:
+                self.logger.error(f"{host}:{port}: {e}")
+        self.logger.info(f"{len(self.servers)} servers listening, {time.monotonic() - start:.1f} s")
+
+    def _blackhole(self, host, port):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.bind((host, port))
+        listener.listen(0)
+        self.sockets.append(listener)
+        for _ in range(BLACKHOLE_FILL):
+            client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            client.setblocking(False)
+            client.connect_ex((host, port))
+            self.sockets.append(client)
+
+    @staticmethod
+    async def _tcp_client(reader, writer):
+        writer.close()
+
+    async def _http_client(self, reader, writer):
+        """
+        Keep-alive HTTP/1.1: SOAP POST (action by body element), GET snapshot
+        """
+        host = "%s:%d" % writer.get_extra_info("sockname")[:2]
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                lines = head.decode("latin-1").split("\r\n")
+                method, path = lines[0].split(" ")[:2]
+                headers = {k.strip().lower(): v.strip() for k, v in
+                           (line.split(":", 1) for line in lines[1:] if ":" in line)}
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                self.requests += 1
+                if self.onvif_delay > 0:
+                    await asyncio.sleep(self.onvif_delay)
+                if random.random() < self.onvif_failure:
+                    status, content_type, content = "500 Internal Server Error", "text/plain", b"failure"
+                elif method == "GET" and path == "/snapshot.jpg":
+                    status, content_type, content = "200 OK", "image/jpeg", SNAPSHOT_JPEG
+                elif method == "POST":
+                    status, content_type, content = self._soap(body, host)
+                else:
+                    status, content_type, content = "404 Not Found", "text/plain", b"not found"
+                writer.write(f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                             f"Content-Length: {len(content)}\r\nConnection: keep-alive\r\n\r\n".encode()
+                             + content)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _soap(body, host):
+        """
+        :return: HTTP status, content type, SOAP response of action found in request body
+        """
+        text = body.decode("utf-8", "replace")
+        for action, template in SOAP_RESPONSES.items():
+            if f":{action}" in text or f"<{action}" in text:
+                response = template.format(now=datetime.now(timezone.utc), host=host, port=host.split(":")[1])
+                return "200 OK", "application/soap+xml; charset=utf-8", \
+                    SOAP_ENVELOPE.format(body=response).encode()
+        return "500 Internal Server Error", "application/soap+xml; charset=utf-8", \
+            SOAP_ENVELOPE.format(body=SOAP_FAULT).encode()
+
+
+if __name__ == "__main__":
+    pass
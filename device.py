@@ -3,17 +3,26 @@
 
 import socket
 import logging
+import threading
+import time
 
-from onvif import ONVIFCamera, ONVIFError
+from onvif_probe import OnvifProbePool
 from ping3 import ping
 from contextlib import closing
 from watch_manager import WatchMethod, WatchFor
-from datetime import datetime
+from tcp_sweep import LINGER_RST
+from span_profile import profiled
+
+PROBE_TIMEOUT = 3  # seconds
+# errors in time measurement in ms
+MEASUREMENT_ERROR = 2
+# Full ONVIF device info refresh interval, liveness is checked by light probe
+ONVIF_INFO_REFRESH = 3600  # seconds
 
 
 class Device:
     def __init__(self, method, watch_for, ip: str, user: str = "none",
-                 password: str = "none", port: int = 0, watched=True):
+                 password: str = "none", port: int = 0, watched=True, interval: int = 0):
         self.watch_method = method if type(method) is WatchMethod else WatchMethod(int(method))
         self.watch_for = watch_for if type(watch_for) is WatchFor else WatchFor(int(watch_for))
         self.ip = ip
@@ -21,10 +30,25 @@ class Device:
         self.password = password
         self.port = int(port)
         self.watched = watched if type(watched) is bool else True if watched == "True" else False
+        # Check interval in seconds, 0 - default interval
+        self.interval = int(interval)
         self.online_stat = None
         self.onvif_device = None
         self.onvif_snapshot_uri = None
+        # onvif_device and onvif_snapshot_uri are used by probe and snapshot threads
+        self.onvif_lock = threading.Lock()
+        self.onvif_info = None
+        self.onvif_info_time = 0
+        # Delay of the last ONVIF light probe, ms
+        self.onvif_rtt = None
+        # Delay of the last check, ms (None if not answered or not measured)
+        self.rtt = None
+        # RttRing and LatencyStats of check results, set by WatchManager
+        self.history = None
+        self.stats = None
         self.trigger_count = 0
+        # Incremented when up/down state, trigger_count or watched changed (not on delay change)
+        self.version = 0
         self.logger = logging.getLogger("Device")
 
     def get_config(self):
@@ -38,9 +62,11 @@ class Device:
             "user": self.user,
             "password": self.password,
             "port": str(self.port),
-            "watched": str(self.watched)
+            "watched": str(self.watched),
+            "interval": str(self.interval)
         }
 
+    @profiled("probe", subject=0)
     def is_online(self):
         """
         Check online device status
@@ -49,34 +75,49 @@ class Device:
             WatchMethod.ONVIF - ONVIF info
             All method write statistics to self.online_stat
         """
-        # errors in time measurement in ms
-        measurement_error = 2
-        self.online_stat = None
         if not self.watched:
+            self.online_stat = None
             return ""
         if self.watch_method == WatchMethod.ONVIF:
+            # onvif (zeep, lxml) is loaded on the first ONVIF device
+            from onvif import ONVIFError
+            stat = None
             try:
-                self.online_stat = self._get_onvif_info()
+                stat = self._onvif_liveness()
             except ONVIFError as e:
                 self.logger.error(e)
         elif self.watch_method == WatchMethod.PORT:
-            port_res = self._port_is_open()
-            if isinstance(port_res, (int, float)):
-                port_res += 1
-            if not bool(port_res):
-                self.online_stat = None
-            else:
-                port_res -= measurement_error
-                self.online_stat = round(port_res) if port_res > 1 else 1
+            stat = self._port_is_open()
         elif self.watch_method == WatchMethod.PING:
-            ping_res = ping(self.ip, timeout=3, unit="ms")
-            if (type(ping_res) == int) or (type(ping_res) == float):
-                ping_res += 1
-            if not bool(ping_res):
-                self.online_stat = None
-            else:
-                ping_res -= measurement_error
-                self.online_stat = round(ping_res) if ping_res > 1 else 1
+            stat = ping(self.ip, timeout=PROBE_TIMEOUT, unit="ms")
+        else:
+            stat = None
+        return self.update_online_stat(stat)
+
+    def update_online_stat(self, stat, measured=True):
+        """
+        Write check result to self.online_stat and update trigger count
+        :param stat:
+            WatchMethod.PING and WatchMethod.PORT - delay ms or None/False
+            WatchMethod.ONVIF - ONVIF info or None
+        :param measured: False if measurement error already subtracted from delay (checked by another process)
+        :return: self.online_stat
+        """
+        old_state = (bool(self.online_stat), self.trigger_count)
+        if isinstance(stat, bool) or not isinstance(stat, (int, float)):
+            self.online_stat = stat if bool(stat) else None
+            self.rtt = self.onvif_rtt if bool(stat) and self.watch_method == WatchMethod.ONVIF else None
+        elif not measured:
+            self.online_stat = round(stat)
+            self.rtt = float(stat)
+        else:
+            stat += 1 - MEASUREMENT_ERROR
+            self.online_stat = round(stat) if stat > 1 else 1
+            self.rtt = float(stat) if stat > 1 else 1.0
+        if self.history is not None and self.watched:
+            self.history.append(time.time(), self.rtt, bool(self.online_stat))
+        if self.stats is not None and self.watched:
+            self.stats.add(self.rtt, bool(self.online_stat))
         # Update trigger count
         if self.watch_for == WatchFor.ONLINE:
             if bool(self.online_stat):
@@ -88,23 +129,67 @@ class Device:
                 self.trigger_count += 1
             else:
                 self.trigger_count = 0
+        if (bool(self.online_stat), self.trigger_count) != old_state:
+            self.version += 1
         return self.online_stat
 
+    @profiled("onvif snapshot uri", subject=0)
     def get_onvif_snapshot(self):
+        from onvif import ONVIFError
+        camera = None
         try:
-            if self.onvif_device is None:
-                self.onvif_device: ONVIFCamera = ONVIFCamera(self.ip, self.port, self.user, self.password)
-                self.onvif_snapshot_uri = None
-            if self.onvif_snapshot_uri is None:
-                media = self.onvif_device.create_media_service(True)
+            camera = self._onvif_camera()
+            with self.onvif_lock:
+                uri = self.onvif_snapshot_uri if self.onvif_device is camera else None
+            if uri is None:
+                media = camera.create_media_service(True)
                 token = media.GetProfiles()[0]["token"]
-                self.onvif_snapshot_uri = media.GetSnapshotUri(token)["Uri"]
-            return self.onvif_snapshot_uri
+                uri = media.GetSnapshotUri(token)["Uri"]
+                with self.onvif_lock:
+                    if self.onvif_device is camera:
+                        self.onvif_snapshot_uri = uri
+            return uri
         except ONVIFError:
-            self.onvif_device = None
-            self.onvif_snapshot_uri = None
+            self._reset_onvif_camera(camera)
+            return None
+
+    def _onvif_camera(self):
+        """
+        :return: ONVIF camera of device, created on the first call (shared by probe and snapshot threads)
+        """
+        from onvif_cache import CachedONVIFCamera
+        with self.onvif_lock:
+            if self.onvif_device is None:
+                self.onvif_device = CachedONVIFCamera(self.ip, self.port, self.user, self.password)
+                self.onvif_snapshot_uri = None
+            return self.onvif_device
+
+    def _reset_onvif_camera(self, camera):
+        """
+        Failed camera is created again by the next call, unless already replaced by another thread
+        """
+        with self.onvif_lock:
+            if camera is not None and self.onvif_device is camera:
+                self.onvif_device = None
+                self.onvif_snapshot_uri = None
+
+    def _onvif_liveness(self):
+        """
+        Light ONVIF check, full device info is fetched once and refreshed rarely
+        :return: ONVIF info (see _get_onvif_info) or None
+        """
+        self.onvif_rtt = OnvifProbePool().probe(self.ip, self.port, PROBE_TIMEOUT)
+        if self.onvif_rtt is None:
             return None
+        if self.onvif_info is None or time.monotonic() - self.onvif_info_time > ONVIF_INFO_REFRESH:
+            info = self._get_onvif_info()
+            if info is None:
+                return None
+            self.onvif_info = info
+            self.onvif_info_time = time.monotonic()
+        return self.onvif_info
 
+    @profiled("onvif info", subject=0)
     def _get_onvif_info(self):
         """
         Get ONVIF info about device
@@ -118,12 +203,13 @@ class Device:
             'HardwareId': '2'
         }
         """
+        from onvif import ONVIFError
+        camera = None
         try:
-            if self.onvif_device is None:
-                self.onvif_device: ONVIFCamera = ONVIFCamera(self.ip, self.port, self.user, self.password)
-            return self.onvif_device.devicemgmt.GetDeviceInformation()
+            camera = self._onvif_camera()
+            return camera.devicemgmt.GetDeviceInformation()
         except ONVIFError as e:
-            self.onvif_device = None
+            self._reset_onvif_camera(camera)
             self.logger.error(e)
             return None
 
@@ -133,15 +219,23 @@ class Device:
         :return: int - connect delay in ms or None
         """
         with closing(socket.socket(socket.AF_INET, socket.SOCK_STREAM)) as sock:
-            sock.settimeout(3)  # seconds
-            start = datetime.timestamp(datetime.now())
+            sock.settimeout(PROBE_TIMEOUT)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, LINGER_RST)
+            start = time.monotonic()
             connected = sock.connect_ex((self.ip, self.port)) == 0
-            stop = datetime.timestamp(datetime.now())
+            stop = time.monotonic()
             delay = None
             if connected:
                 delay = round((stop - start) * 1000)
             return delay
 
+    @property
+    def key(self):
+        """
+        :return: unique key of device in inventory
+        """
+        return self.watch_method, self.ip, self.port, self.watch_for
+
     def __str__(self):
         return f"{self.watch_method}{self.port if self.port > 0 else ''}@{self.ip}"
 
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+import queue
+import signal
+import threading
+from settings import Settings
+from watch_manager import WatchManager, Watcher
+from device import Device
+
+
+class HeadlessWatchdog:
+    """
+    Runs watchers of inventory without GUI (PyQt5 is never imported):
+    devices are checked by probe engine, changed statuses are written to journal
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger("Headless")
+        self.settings = Settings()
+        self.WM = WatchManager()
+        # Checked devices, journal (sqlite) is written only from the main thread
+        self.results = queue.Queue()
+        self.stopped = threading.Event()
+        self.WM.engine.on_result = self.results.put
+        for config in self.WM.inventory.devices():
+            self.WM.add_watch(Watcher(Device(*config)), rebuild=False)
+        self.logger.info(f"Loaded {len(self.WM.watchers)} watchers")
+
+    def stop(self, *args):
+        self.stopped.set()
+
+    def run(self):
+        """
+        Check devices until SIGINT / SIGTERM
+        :return: exit code
+        """
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+        self.WM.engine.start()
+        try:
+            while not self.stopped.is_set():
+                try:
+                    device = self.results.get(timeout=1)
+                except queue.Empty:
+                    continue
+                w = self.WM.watcher(device)
+                if w is not None and self.WM.check_trigger(w):
+                    self.logger.warning(f"{w}: {'Онлайн' if bool(device.online_stat) else 'Оффлайн'}")
+        finally:
+            self.WM.stop()
+        self.logger.info("Headless watchdog stopped")
+        return 0
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import socket
+import struct
+import logging
+import selectors
+import time
+from span_profile import profiled
+
+ICMP_ECHO_REPLY = 0
+ICMP_ECHO_REQUEST = 8
+ICMP_HEADER = struct.Struct("!BBHHH")
+PAYLOAD = b"net_watchdog-sweep"
+MAX_SEQUENCE = 0xFFFF
+RECV_BUFFER = 4 * 1024 * 1024  # bytes, replies of a whole sweep arrive at once
+
+
+def checksum(data: bytes):
+    """
+    RFC 1071 internet checksum
+    """
+    if len(data) % 2:
+        data += b"\0"
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+class IcmpSweeper:
+    """
+    Sends ICMP echo requests to many hosts from a single socket
+    and matches replies by identifier/sequence.
+    Uses unprivileged ICMP datagram socket where the kernel allows it, raw socket otherwise.
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger("IcmpSweeper")
+        self.identifier = os.getpid() & 0xFFFF
+        self.sequence = 0
+        self.raw = False
+        # None - not checked yet, False - no ICMP socket available (no privileges)
+        self.supported = None
+
+    def _open_socket(self):
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+            self.raw = False
+        except OSError:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
+            self.raw = True
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BUFFER)
+        except OSError:
+            pass
+        sock.setblocking(False)
+        return sock
+
+    def available(self):
+        """
+        :return: True if ICMP socket can be opened
+        """
+        if self.supported is None:
+            try:
+                self._open_socket().close()
+                self.supported = True
+                self.logger.info(f"ICMP sweep uses {'raw' if self.raw else 'datagram'} socket")
+            except OSError as e:
+                self.supported = False
+                self.logger.warning(f"ICMP socket not available: {e}")
+        return self.supported
+
+    @profiled("icmp sweep")
+    def sweep(self, hosts, timeout):
+        """
+        Ping all hosts at once
+        :param hosts: iterable of host names / ip addresses
+        :param timeout: seconds to wait for replies
+        :return: dict {host: delay ms or None}
+        """
+        results = dict.fromkeys(hosts)
+        targets = []
+        for host in results:
+            try:
+                targets.append((host, socket.gethostbyname(host)))
+            except OSError as e:
+                self.logger.debug(f"{host}: {e}")
+        with self._open_socket() as sock:
+            # One sequence number per host, sent in chunks if sequence space is exhausted
+            for index in range(0, len(targets), MAX_SEQUENCE):
+                self._sweep_chunk(sock, targets[index:index + MAX_SEQUENCE], timeout, results)
+        return results
+
+    def _sweep_chunk(self, sock, targets, timeout, results):
+        waiting = {}  # sequence: (host, address, send time)
+        to_send = list(reversed(targets))
+        selector = selectors.DefaultSelector()
+        selector.register(sock, selectors.EVENT_READ | selectors.EVENT_WRITE)
+        deadline = time.monotonic() + timeout
+        try:
+            while waiting or to_send:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                for key, events in selector.select(remaining):
+                    if events & selectors.EVENT_READ:
+                        self._receive(sock, waiting, results, timeout)
+                    if events & selectors.EVENT_WRITE and to_send:
+                        self._send(sock, to_send, waiting)
+                        if not to_send:
+                            selector.modify(sock, selectors.EVENT_READ)
+                        # Every host gets the whole timeout window
+                        deadline = time.monotonic() + timeout
+        finally:
+            selector.close()
+
+    def _send(self, sock, to_send, waiting):
+        while to_send:
+            host, address = to_send[-1]
+            self.sequence = (self.sequence + 1) & MAX_SEQUENCE
+            header = ICMP_HEADER.pack(ICMP_ECHO_REQUEST, 0, 0, self.identifier, self.sequence)
+            packet_checksum = checksum(header + PAYLOAD)
+            header = ICMP_HEADER.pack(ICMP_ECHO_REQUEST, 0, packet_checksum, self.identifier, self.sequence)
+            try:
+                sock.sendto(header + PAYLOAD, (address, 0))
+            except BlockingIOError:
+                # Socket buffer is full, wait for EVENT_WRITE
+                return
+            except OSError as e:
+                self.logger.debug(f"{host}: {e}")
+            else:
+                waiting[self.sequence] = (host, address, time.monotonic())
+            to_send.pop()
+
+    def _receive(self, sock, waiting, results, timeout):
+        while True:
+            try:
+                data, (address, _) = sock.recvfrom(2048)
+            except (BlockingIOError, InterruptedError):
+                return
+            received = time.monotonic()
+            # Raw sockets (and datagram sockets on some systems) deliver the IP header too
+            if len(data) > 0 and data[0] >> 4 == 4:
+                data = data[(data[0] & 0x0F) * 4:]
+            if len(data) < ICMP_HEADER.size:
+                continue
+            icmp_type, _, _, identifier, sequence = ICMP_HEADER.unpack_from(data)
+            # Kernel replaces identifier of datagram ICMP sockets
+            if icmp_type != ICMP_ECHO_REPLY or (self.raw and identifier != self.identifier):
+                continue
+            pending = waiting.get(sequence)
+            if pending is None or pending[1] != address:
+                continue
+            del waiting[sequence]
+            host, _, sent = pending
+            delay = (received - sent) * 1000
+            if delay <= timeout * 1000:
+                results[host] = delay
+
+
+if __name__ == "__main__":
+    import sys
+    sweeper = IcmpSweeper()
+    if sweeper.available():
+        print(sweeper.sweep(sys.argv[1:] or ["127.0.0.1"], 3))
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import csv
+import json
+import logging
+import shutil
+import sqlite3
+from itertools import islice
+from os.path import splitext
+from settings import Settings
+
+# Columns of devices table, import and export files, order of Device() arguments
+COLUMNS = ("watch_method", "watch_for", "ip", "user", "password", "port", "watched", "interval")
+# Unique key of device (Device.key)
+KEY_COLUMNS = ("watch_method", "ip", "port", "watch_for")
+# Rows inserted by one executemany() of import
+IMPORT_CHUNK = 1000
+# Rows fetched by one fetchmany() of export
+EXPORT_CHUNK = 1000
+# Characters read by one read() of JSON array import
+JSON_READ_CHUNK = 65536
+FORMATS = {".csv": "csv", ".json": "json", ".jsonl": "jsonl", ".ndjson": "jsonl"}
+
+_UPSERT = f'INSERT INTO devices ({", ".join(COLUMNS)}) VALUES ({", ".join("?" * len(COLUMNS))}) ' \
+          f'ON CONFLICT ({", ".join(KEY_COLUMNS)}) DO UPDATE SET ' \
+          f'user = excluded.user, password = excluded.password, watched = excluded.watched, ' \
+          f'interval = excluded.interval;'
+_KEY_CONDITION = " AND ".join(f"{column} = ?" for column in KEY_COLUMNS)
+
+
+class Inventory:
+    """
+    Devices of watchers in sqlite table with unique index by method, ip, port and watch_for.
+    Devices are written on change (add, remove, enable), bulk import and export of
+    CSV / JSON / JSON Lines files are streamed by chunks in one transaction.
+    Watchers of settings file (WatchMethod.* sections) are moved to inventory on open.
+    """
+
+    # Singleton
+    def __new__(cls, *args):
+        if not hasattr(cls, 'instance'):
+            cls.instance = super(Inventory, cls).__new__(cls)
+        return cls.instance
+
+    def __init__(self):
+        if hasattr(self, 'db_path'):
+            return
+        self.logger = logging.getLogger('Inventory')
+        self.db_path = './res/inventory.db'
+        self.db = sqlite3.connect(self.db_path)
+        self.db.execute('PRAGMA journal_mode=WAL;')
+        self.db.execute('PRAGMA synchronous=NORMAL;')
+        self._create_db()
+        self._move_settings_watchers()
+
+    def _create_db(self):
+        with self.db:
+            self.db.execute('CREATE TABLE IF NOT EXISTS devices (id INTEGER PRIMARY KEY, watch_method INTEGER, '
+                            'watch_for INTEGER, ip TEXT, user TEXT, password TEXT, port INTEGER, '
+                            'watched INTEGER, interval INTEGER);')
+            self.db.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS devices_key ON devices ({", ".join(KEY_COLUMNS)});')
+
+    def _move_settings_watchers(self):
+        """
+        Watchers of settings file (previous versions) are added to inventory and removed from settings
+        after commit, settings file is copied to settings.ini.bak before.
+        Invalid watchers are left in settings file.
+        """
+        settings = Settings()
+        if len(settings.watchers) == 0:
+            return
+        self.logger.info(f"Move {len(settings.watchers)} watchers from settings file to inventory...")
+        moved = []
+
+        def records():
+            for section in settings.watchers:
+                record = dict(settings.config[section])
+                try:
+                    self._row(record)
+                except (KeyError, ValueError, TypeError, AttributeError):
+                    # Counted as invalid by _import_rows()
+                    yield record
+                    continue
+                moved.append(section)
+                yield record
+
+        imported, invalid = self._import_rows(records())
+        if invalid > 0:
+            self.logger.error(f"{invalid} watchers of settings file are invalid, left in settings file")
+        shutil.copy2(settings.file, settings.file + ".bak")
+        for section in moved:
+            settings.remove_watcher(section)
+        settings.write_settings()
+
+    def __len__(self):
+        return self.db.execute('SELECT count(*) FROM devices;').fetchone()[0]
+
+    def devices(self):
+        """
+        :return: generator of device configs (Device() arguments), in order of adding
+        """
+        cursor = self.db.execute(f'SELECT {", ".join(COLUMNS)} FROM devices ORDER BY id;')
+        while True:
+            rows = cursor.fetchmany(EXPORT_CHUNK)
+            if len(rows) == 0:
+                break
+            for row in rows:
+                yield row[:6] + (bool(row[6]), row[7])
+
+    def add(self, config):
+        """
+        :param config: Device.get_config()
+        :return: False if device with the same key exists
+        """
+        try:
+            with self.db:
+                self.db.execute(f'INSERT INTO devices ({", ".join(COLUMNS)}) '
+                                f'VALUES ({", ".join("?" * len(COLUMNS))});', self._row(config))
+        except sqlite3.IntegrityError:
+            return False
+        return True
+
+    def update(self, config):
+        """
+        Add device or update existing device of the same key
+        :param config: Device.get_config()
+        """
+        with self.db:
+            self.db.execute(_UPSERT, self._row(config))
+
+    def remove(self, config):
+        """
+        :param config: Device.get_config()
+        """
+        row = dict(zip(COLUMNS, self._row(config)))
+        with self.db:
+            self.db.execute(f'DELETE FROM devices WHERE {_KEY_CONDITION};', [row[column] for column in KEY_COLUMNS])
+
+    def import_file(self, path, file_format=None):
+        """
+        Add devices of file, devices of existing keys are updated
+        :param file_format: csv, json (array of objects) or jsonl (object per line), None - by file extension
+        :return: (imported devices, invalid records)
+        """
+        file_format = file_format or self.file_format(path)
+        with open(path, newline="", encoding="utf-8") as f:
+            if file_format == "csv":
+                records = csv.DictReader(f)
+            elif file_format == "json":
+                records = self._json_array(f)
+            else:
+                records = (json.loads(line) for line in f if line.strip())
+            imported, invalid = self._import_rows(records)
+        self.logger.info(f"Imported {imported} devices from {path}, invalid records: {invalid}")
+        return imported, invalid
+
+    def export_file(self, path, file_format=None):
+        """
+        :param file_format: csv, json or jsonl, None - by file extension
+        :return: exported devices
+        """
+        file_format = file_format or self.file_format(path)
+        count = 0
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            if file_format == "csv":
+                writer = csv.writer(f)
+                writer.writerow(COLUMNS)
+            elif file_format == "json":
+                f.write("[")
+            for config in self.devices():
+                if file_format == "csv":
+                    writer.writerow(config)
+                else:
+                    record = json.dumps(dict(zip(COLUMNS, config)), ensure_ascii=False)
+                    if file_format == "json":
+                        record = f"{',' if count > 0 else ''}\n  {record}"
+                    else:
+                        record += "\n"
+                    f.write(record)
+                count += 1
+            if file_format == "json":
+                f.write("\n]\n")
+        self.logger.info(f"Exported {count} devices to {path}")
+        return count
+
+    @staticmethod
+    def file_format(path):
+        """
+        :return: csv, json or jsonl by file extension
+        """
+        extension = splitext(path)[1].lower()
+        if extension not in FORMATS:
+            raise ValueError(f"Unknown format of {path}, expected: {', '.join(FORMATS)}")
+        return FORMATS[extension]
+
+    @staticmethod
+    def _json_array(f):
+        """
+        Parse JSON array of file by chunks
+        :return: generator of array items
+        """
+        decoder = json.JSONDecoder()
+        buffer = ""
+        position = 0
+        eof = False
+        expected = "["  # "[", "item" (or "]" if the first), ","
+        first = True
+        while True:
+            while position < len(buffer) and buffer[position].isspace():
+                position += 1
+            if position < len(buffer):
+                char = buffer[position]
+                if expected == "[":
+                    if char != "[":
+                        raise ValueError("JSON array expected")
+                    position += 1
+                    expected = "item"
+                    continue
+                if char == "]" and (expected == "," or first):
+                    return
+                if expected == ",":
+                    if char != ",":
+                        raise ValueError("',' or ']' expected in JSON array")
+                    position += 1
+                    expected = "item"
+                    continue
+                try:
+                    item, end = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    # Item is not read to the end yet
+                    if eof:
+                        raise
+                else:
+                    # Item is complete if followed by separator (number may continue in the next chunk)
+                    if eof or (end < len(buffer) and buffer[end] in " \t\r\n,]"):
+                        position = end
+                        expected = ","
+                        first = False
+                        yield item
+                        continue
+            if eof:
+                raise ValueError("Unexpected end of JSON array")
+            chunk = f.read(JSON_READ_CHUNK)
+            eof = len(chunk) == 0
+            buffer = buffer[position:] + chunk
+            position = 0
+
+    def _import_rows(self, records):
+        """
+        :param records: iterable of dicts (COLUMNS keys, method and watch_for by value or name)
+        :return: (imported, invalid)
+        """
+        invalid = 0
+
+        def rows():
+            nonlocal invalid
+            for record in records:
+                try:
+                    yield self._row(record)
+                except (KeyError, ValueError, TypeError, AttributeError) as e:
+                    invalid += 1
+                    self.logger.warning(f"Invalid device {record}: {e!r}")
+
+        changes = self.db.total_changes
+        rows = rows()
+        with self.db:
+            while True:
+                chunk = list(islice(rows, IMPORT_CHUNK))
+                if len(chunk) == 0:
+                    break
+                self.db.executemany(_UPSERT, chunk)
+        return self.db.total_changes - changes, invalid
+
+    @staticmethod
+    def _row(config):
+        """
+        :param config: dict of COLUMNS (Device.get_config(), record of import file)
+        :return: values of COLUMNS
+        """
+        # Imported here: watch_manager depends on inventory
+        from watch_manager import WatchMethod, WatchFor
+
+        def enum_value(enum, value):
+            value = str(value).strip()
+            if value.isdigit():
+                return enum(int(value)).value
+            return enum[value.rpartition(".")[2].upper()].value
+
+        ip = str(config["ip"]).strip()
+        if len(ip) == 0:
+            raise ValueError("empty ip")
+        port = int(config.get("port") or 0)
+        if not 0 <= port <= 65535:
+            raise ValueError(f"port {port}")
+        watched = config.get("watched")
+        if watched is None or watched == "":
+            watched = True
+        elif not isinstance(watched, bool):
+            watched = str(watched).strip().lower() not in ("false", "0", "no")
+        return (enum_value(WatchMethod, config["watch_method"]),
+                enum_value(WatchFor, config.get("watch_for") or WatchFor.ONLINE.value),
+                ip,
+                str(config.get("user") or "none"),
+                str(config.get("password") or "none"),
+                port,
+                int(watched),
+                int(config.get("interval") or 0))
+
+
+if __name__ == "__main__":
+    pass
@@ -1,14 +1,46 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 import logging
+import queue
 import sqlite3
+import threading
+import time
 from logging import Logger
 from observer import Observer, Observable
+from settings import Settings
+from metrics import Metrics
+from span_profile import profiled, span
 
-DB_VERSION = 1
+DB_VERSION = 3
+# Max records written in one transaction
+BATCH_SIZE = 10000
+# Default page size of query()
+PAGE_SIZE = 100
+# Expired records are rolled up by chunks, between chunks queued records are written
+COMPACT_CHUNK = 5000
+# First compaction after start, seconds
+COMPACT_DELAY = 60
+# Compaction pass interval, seconds
+COMPACT_INTERVAL = 3600
+DAY = 86400  # seconds
+
+RECORDS = Metrics().counter("journal_records_total", "Journal records queued")
+WRITTEN = Metrics().counter("journal_written_total", "Journal records written")
+COMMITS = Metrics().counter("journal_commits_total", "Journal write transactions")
+COMMIT_DURATION = Metrics().histogram("journal_commit_duration_seconds", "Journal write transaction duration")
+ROLLED_UP = Metrics().counter("journal_rolled_up_total", "Expired journal records rolled up into daily summaries")
 
 
 class JournalDb(Observable):
+    """
+    Journal of watchers events.
+    Records are queued by add_record() from any thread and written by the writer thread
+    in batches (one transaction per batch), observers are notified once per batch
+    from the writer thread.
+    Records older than retention days are rolled up into journal_daily
+    (count of events per day, watcher and event) by the writer thread when it is idle.
+    Schema is upgraded by the writer thread too, readers wait for upgrade.
+    """
 
     # Singleton
     def __new__(cls, *args):
@@ -23,32 +55,44 @@ class JournalDb(Observable):
         self.db_path = './res/journal.db'
         self.logger.debug('Open journal db...')
         self.observers = []
+        self.queue = queue.Queue()
+        Metrics().gauge("journal_queue_length", "Journal records waiting for write", function=self.queue.qsize)
+        self.db = None
+        self.retention_days = Settings().snapshot.journal_retention_days
+        # Set by the writer thread when db is upgraded (upgrade of a big journal takes seconds)
+        self.ready = threading.Event()
         try:
+            # Connection of readers, schema is upgraded by the writer thread
             self.db = sqlite3.connect(self.db_path)
-            self.upgrade_db()
         except sqlite3.Error as e:
             self.logger.error(e)
+        self.writer = threading.Thread(target=self._write_records, name="JournalWriter", daemon=True)
+        self.writer.start()
 
-    def upgrade_db(self, version=DB_VERSION):
+    def upgrade_db(self, db, version=DB_VERSION):
         """
         Provides upgrade database when schema has changed
         """
         self.logger.debug(f'Upgrade db to version {version} ...')
-        db_ver = self._get_db_ver()
+        db_ver = self._get_db_ver(db)
         if db_ver < version:
             if db_ver == 0:
                 # Create new db
                 self.logger.debug('Create new db...')
-                self._create_db()
-            # if db_ver == 1:
-                # [ code ] to update to ver 2
-                # ...
+                self._create_db(db)
+                db_ver = 1
+            if db_ver == 1:
+                self._upgrade_db_v2(db)
+                db_ver = 2
+            if db_ver == 2:
+                self._upgrade_db_v3(db)
+                db_ver = 3
         else:
             self.logger.debug(f'Update not needed, exiting...')
 
-    def _get_db_ver(self):
+    def _get_db_ver(self, db):
         ver = 0
-        cursor = self.db.cursor()
+        cursor = db.cursor()
         try:
             sql = 'SELECT version FROM version;'
             cursor.execute(sql)
@@ -60,11 +104,11 @@ class JournalDb(Observable):
         cursor.close()
         return ver
 
-    def _create_db(self):
+    def _create_db(self, db):
         """
         Creates new database
         """
-        cursor = self.db.cursor()
+        cursor = db.cursor()
         try:
             sql = 'CREATE TABLE version (version INTEGER);'
             cursor.execute(sql)
@@ -73,26 +117,138 @@ class JournalDb(Observable):
             sql = 'CREATE TABLE journal (id INTEGER PRIMARY KEY, ' \
                   'timestamp INTEGER, watcher TEXT, event TEXT, msg TEXT);'
             cursor.execute(sql)
-            self.db.commit()
+            db.commit()
         except sqlite3.Error as e:
             self.logger.error(e)
         else:
             self.logger.debug('Database created!')
         cursor.close()
 
+    def _upgrade_db_v2(self, db):
+        """
+        Version 2: indexes for query() by watcher and timestamp range
+        """
+        self.logger.debug('Upgrade db to version 2, create indexes...')
+        try:
+            with db:
+                db.execute('CREATE INDEX IF NOT EXISTS journal_watcher_timestamp ON journal (watcher, timestamp);')
+                db.execute('CREATE INDEX IF NOT EXISTS journal_timestamp ON journal (timestamp);')
+                db.execute('UPDATE version SET version = 2;')
+        except sqlite3.Error as e:
+            self.logger.error(e)
+
+    def _upgrade_db_v3(self, db):
+        """
+        Version 3: daily rollup of expired records, incremental vacuum
+        """
+        self.logger.debug('Upgrade db to version 3, create journal_daily...')
+        try:
+            with db:
+                db.execute('CREATE TABLE IF NOT EXISTS journal_daily (day INTEGER, watcher TEXT, event TEXT, '
+                                'count INTEGER, first_timestamp REAL, last_timestamp REAL, '
+                                'PRIMARY KEY (day, watcher, event));')
+                db.execute('UPDATE version SET version = 3;')
+            if db.execute('PRAGMA auto_vacuum;').fetchone()[0] != 2:
+                # Takes effect after full vacuum, once
+                self.logger.info('Enable incremental vacuum of journal db...')
+                db.execute('PRAGMA auto_vacuum=INCREMENTAL;')
+                db.execute('VACUUM;')
+        except sqlite3.Error as e:
+            self.logger.error(e)
+
+    def query(self, watcher=None, event=None, since=None, until=None, before=None, after_id=None,
+              limit=PAGE_SIZE):
+        """
+        Select journal records, newest first (by timestamp, then id)
+        :param watcher: watcher name (str(device)), None - all watchers
+        :param event: event, e.g. 'Оффлайн', None - all events
+        :param since: timestamp from (included), None - from first record
+        :param until: timestamp to (excluded), None - to last record
+        :param before: (timestamp, id) of the last record of previous page, None - first page
+                       (not looked up by id: the record may be already rolled up)
+        :param after_id: only records added after record with this id (new records)
+        :param limit: max count of records, 0 - no limit
+        :return: list of rows (id, timestamp, watcher, event, msg)
+        """
+        conditions = []
+        params = []
+        if watcher is not None:
+            conditions.append('watcher = ?')
+            params.append(str(watcher))
+        if event is not None:
+            conditions.append('event = ?')
+            params.append(event)
+        if since is not None:
+            conditions.append('timestamp >= ?')
+            params.append(since)
+        if until is not None:
+            conditions.append('timestamp < ?')
+            params.append(until)
+        if before is not None:
+            # Keyset pagination, served by timestamp indexes (rowid is the last index column)
+            conditions.append('(timestamp, id) < (?, ?)')
+            params.extend(before)
+        if after_id is not None:
+            conditions.append('id > ?')
+            params.append(after_id)
+        sql = 'SELECT id, timestamp, watcher, event, msg FROM journal'
+        if len(conditions) > 0:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY timestamp DESC, id DESC'
+        if limit > 0:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        rows = []
+        self.ready.wait()
+        try:
+            rows = self.db.execute(sql + ';', params).fetchall()
+        except sqlite3.Error as e:
+            self.logger.error(e)
+        return rows
+
+    def query_daily(self, watcher=None, since=None, until=None):
+        """
+        Select daily rollup of expired records, newest first
+        :param watcher: watcher name (str(device)), None - all watchers
+        :param since: timestamp from (included), None - from first day
+        :param until: timestamp to (excluded), None - to last day
+        :return: list of rows (day timestamp, watcher, event, count, first timestamp, last timestamp)
+        """
+        conditions = []
+        params = []
+        if watcher is not None:
+            conditions.append('watcher = ?')
+            params.append(str(watcher))
+        if since is not None:
+            conditions.append('day >= ?')
+            params.append(int(since // DAY))
+        if until is not None:
+            conditions.append('day < ?')
+            params.append(int(-(-until // DAY)))
+        sql = f'SELECT day * {DAY}, watcher, event, count, first_timestamp, last_timestamp FROM journal_daily'
+        if len(conditions) > 0:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        rows = []
+        self.ready.wait()
+        try:
+            rows = self.db.execute(sql + ' ORDER BY day DESC, watcher, event;', params).fetchall()
+        except sqlite3.Error as e:
+            self.logger.error(e)
+        return rows
+
     def read_all(self, limit=0, offset=0):
         """
         Select journal records from db
         return 2d array (list/tuple)
         """
+        self.ready.wait()
         cursor = self.db.cursor()
         rows = [[]]
         try:
             if limit == 0:
-                sql = 'SELECT * FROM journal ORDER BY id DESC;'
+                cursor.execute('SELECT * FROM journal ORDER BY id DESC;')
             else:
-                sql = f'SELECT * FROM journal ORDER BY id DESC LIMIT {limit} OFFSET {offset} ;'
-            cursor.execute(sql)
+                cursor.execute('SELECT * FROM journal ORDER BY id DESC LIMIT ? OFFSET ?;', (limit, offset))
             rows = cursor.fetchall()
         except sqlite3.Error as e:
             self.logger.error(e)
@@ -101,21 +257,119 @@ class JournalDb(Observable):
         cursor.close()
         return rows
 
+    @profiled("journal add_record")
     def add_record(self, timestamp, watcher, event, msg):
         """
-        Add new row to db
+        Queue new row, it is written to db by the writer thread
+        """
+        self.queue.put((timestamp, str(watcher), event, msg))
+        RECORDS.inc()
+
+    def flush(self):
+        """
+        Wait until all queued records are written
+        """
+        self.queue.join()
+
+    def close(self):
+        """
+        Write queued records and stop the writer thread
+        """
+        if self.writer.is_alive():
+            self.queue.put(None)
+            self.writer.join()
+
+    def _write_records(self):
+        """
+        Writer thread: upgrades db, waits for records, writes all queued ones in one transaction,
+        compacts journal when there is nothing to write
         """
-        cursor = self.db.cursor()
         try:
-            sql = f"INSERT INTO journal (timestamp, watcher, event, msg)" \
-                f" VALUES ('{timestamp}', '{str(watcher)}', '{event}', '{msg}');"
-            cursor.execute(sql)
+            db = sqlite3.connect(self.db_path)
+            # Readers do not block the writer, commits are not fsync'ed (safe in WAL mode)
+            db.execute('PRAGMA journal_mode=WAL;')
+            db.execute('PRAGMA synchronous=NORMAL;')
+            self.upgrade_db(db)
         except sqlite3.Error as e:
             self.logger.error(e)
-        else:
-            self.db.commit()
-            self.notify_observers()
-        cursor.close()
+            return
+        finally:
+            self.ready.set()
+        compact_time = time.monotonic() + COMPACT_DELAY if self.retention_days > 0 else None
+        stopped = False
+        while not stopped:
+            try:
+                timeout = None if compact_time is None else max(compact_time - time.monotonic(), 0)
+                batch = [self.queue.get(timeout=timeout)]
+            except queue.Empty:
+                # Next chunk right after this one if expired records left
+                more = self._compact(db)
+                compact_time = time.monotonic() + (0 if more else COMPACT_INTERVAL)
+                continue
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            records = [record for record in batch if record is not None]
+            stopped = len(records) < len(batch)
+            if len(records) > 0:
+                start = time.monotonic()
+                try:
+                    with span("journal commit"), db:
+                        db.executemany('INSERT INTO journal (timestamp, watcher, event, msg) VALUES (?, ?, ?, ?);',
+                                       records)
+                except sqlite3.Error as e:
+                    self.logger.error(e)
+                else:
+                    COMMITS.inc()
+                    WRITTEN.inc(amount=len(records))
+                    COMMIT_DURATION.observe(time.monotonic() - start)
+                    self.logger.debug(f'Written {len(records)} records')
+                    self.notify_observers()
+            for _ in batch:
+                self.queue.task_done()
+        db.close()
+
+    def _compact(self, db):
+        """
+        Writer thread: roll up one chunk of expired records into journal_daily,
+        delete them and free their pages
+        :return: True if expired records left
+        """
+        expire_time = time.time() - self.retention_days * DAY
+        try:
+            records = db.execute('SELECT id, timestamp, watcher, event FROM journal WHERE timestamp < ? '
+                                 'ORDER BY timestamp LIMIT ?;', (expire_time, COMPACT_CHUNK)).fetchall()
+            if len(records) == 0:
+                return False
+            daily = {}  # (day, watcher, event): [count, first timestamp, last timestamp]
+            for _, timestamp, watcher, event in records:
+                timestamp = float(timestamp)
+                summary = daily.get((int(timestamp // DAY), watcher, event))
+                if summary is None:
+                    daily[(int(timestamp // DAY), watcher, event)] = [1, timestamp, timestamp]
+                else:
+                    summary[0] += 1
+                    summary[1] = min(summary[1], timestamp)
+                    summary[2] = max(summary[2], timestamp)
+            with db:
+                db.executemany('INSERT INTO journal_daily VALUES (?, ?, ?, ?, ?, ?) '
+                               'ON CONFLICT (day, watcher, event) DO UPDATE SET count = count + excluded.count, '
+                               'first_timestamp = min(first_timestamp, excluded.first_timestamp), '
+                               'last_timestamp = max(last_timestamp, excluded.last_timestamp);',
+                               [key + tuple(summary) for key, summary in daily.items()])
+                db.executemany('DELETE FROM journal WHERE id = ?;', [(record[0],) for record in records])
+            # executescript() steps pragma to the end, execute() frees one page only
+            db.executescript('PRAGMA incremental_vacuum;')
+            # Freed pages are truncated from db file by checkpoint
+            db.execute('PRAGMA wal_checkpoint(PASSIVE);').fetchall()
+        except sqlite3.Error as e:
+            self.logger.error(e)
+            return False
+        ROLLED_UP.inc(amount=len(records))
+        self.logger.debug(f'Rolled up {len(records)} expired records')
+        return len(records) == COMPACT_CHUNK
 
     def attach(self, observer):
         """
@@ -131,13 +385,13 @@ class JournalDb(Observable):
 
     def notify_observers(self):
         """
-        Notify observers about journal changes
+        Notify observers about journal changes (invoked from the writer thread)
         """
-        for observer in self.observers:
+        for observer in list(self.observers):
             observer.changed()
 
     def __del__(self):
-        if self.db is not None:
+        if getattr(self, 'db', None) is not None:
             self.logger.debug('Closing db.')
             self.db.close()
 
@@ -147,6 +401,7 @@ if __name__ == "__main__":
     journal = JournalDb()
     for i in range(200):
         journal.add_record(datetime.utcnow().timestamp(), "PING@127.0.0.1", 'Онлайн', 'Утсройство появилось в сети')
+    journal.close()
     pass
 
 
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from array import array
+
+# Samples kept in memory per device (an hour of 5 second checks, 6 bytes per sample)
+RING_SIZE = 720
+# Stored delay values, delays are stored in 0.1 ms units
+RTT_SCALE = 10
+MAX_RTT = 0xFFFD
+NO_RTT = 0xFFFE  # answered, delay unknown
+DOWN = 0xFFFF  # not answered
+MINUTE = 60  # seconds
+HOUR = 3600  # seconds
+DAY = 86400  # seconds
+# Downsampled rows are deleted after
+MINUTE_RETENTION_DAYS = 7
+HOUR_RETENTION_DAYS = 365
+# Max rows written in one transaction
+BATCH_SIZE = 10000
+PRUNE_INTERVAL = 3600  # seconds
+
+
+class _Bucket:
+    """
+    Summary of samples of one minute or hour
+    """
+    __slots__ = ('start', 'samples', 'up', 'measured', 'rtt_min', 'rtt_sum', 'rtt_max')
+
+    def __init__(self, start):
+        self.start = start
+        self.samples = 0
+        self.up = 0
+        self.measured = 0
+        self.rtt_min = None
+        self.rtt_sum = 0.0
+        self.rtt_max = None
+
+    def add(self, rtt, online):
+        self.samples += 1
+        if online:
+            self.up += 1
+        if rtt is not None:
+            self.measured += 1
+            self.rtt_sum += rtt
+            self.rtt_min = rtt if self.rtt_min is None else min(self.rtt_min, rtt)
+            self.rtt_max = rtt if self.rtt_max is None else max(self.rtt_max, rtt)
+
+    def merge(self, other):
+        self.samples += other.samples
+        self.up += other.up
+        if other.measured > 0:
+            self.measured += other.measured
+            self.rtt_sum += other.rtt_sum
+            self.rtt_min = other.rtt_min if self.rtt_min is None else min(self.rtt_min, other.rtt_min)
+            self.rtt_max = other.rtt_max if self.rtt_max is None else max(self.rtt_max, other.rtt_max)
+
+    def row(self, resolution, watcher):
+        return (resolution, watcher, self.start, self.samples, self.up, self.measured,
+                self.rtt_min, self.rtt_sum, self.rtt_max)
+
+
+class RttRing:
+    """
+    Recent check results of one device: timestamps (uint32 seconds) and delays (uint16) in fixed size arrays.
+    Samples are summarized per minute and per hour, closed summaries are passed to sink
+    (LatencyHistory writes them to history db).
+    Samples are appended by probe threads while flush() may be called by GUI thread, both under ring lock
+    (a minute is passed to sink once).
+    """
+    __slots__ = ('watcher', 'sink', 'times', 'rtts', 'head', 'count', 'minute', 'hour', 'lock')
+
+    def __init__(self, watcher, sink, size=RING_SIZE):
+        """
+        :param watcher: watcher name (str(device))
+        :param sink: callable(row) of closed summaries
+        """
+        self.watcher = watcher
+        self.sink = sink
+        self.times = array('I', bytes(4 * size))
+        self.rtts = array('H', bytes(2 * size))
+        self.head = 0  # next sample position
+        self.count = 0
+        self.minute = None
+        self.hour = None
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.count
+
+    def append(self, timestamp, rtt, online):
+        """
+        :param timestamp: UTC seconds
+        :param rtt: delay ms or None if unknown
+        :param online: device answered
+        """
+        if not online:
+            value = DOWN
+        elif rtt is None:
+            value = NO_RTT
+        else:
+            value = min(max(round(rtt * RTT_SCALE), 0), MAX_RTT)
+        start = int(timestamp) // MINUTE * MINUTE
+        with self.lock:
+            self.times[self.head] = int(timestamp)
+            self.rtts[self.head] = value
+            self.head = (self.head + 1) % len(self.rtts)
+            self.count = min(self.count + 1, len(self.rtts))
+
+            if self.minute is not None and self.minute.start != start:
+                self._close_minute()
+            if self.minute is None:
+                self.minute = _Bucket(start)
+            self.minute.add(None if value >= NO_RTT else value / RTT_SCALE, online)
+
+    def samples(self, since=0):
+        """
+        :param since: UTC seconds, samples before are skipped
+        :return: list of (timestamp, delay ms or None, online), oldest first
+        """
+        size = len(self.rtts)
+        result = []
+        with self.lock:
+            for i in range(self.head - self.count, self.head):
+                timestamp, value = self.times[i % size], self.rtts[i % size]
+                if timestamp >= since:
+                    result.append((timestamp, None if value >= NO_RTT else value / RTT_SCALE, value != DOWN))
+        return result
+
+    def flush(self):
+        """
+        Pass not closed minute and hour summaries to sink (on stop)
+        """
+        with self.lock:
+            if self.minute is not None:
+                self._close_minute()
+            if self.hour is not None:
+                self.sink(self.hour.row(HOUR, self.watcher))
+                self.hour = None
+
+    def _close_minute(self):
+        minute, self.minute = self.minute, None
+        self.sink(minute.row(MINUTE, self.watcher))
+        start = minute.start // HOUR * HOUR
+        if self.hour is not None and self.hour.start != start:
+            self.sink(self.hour.row(HOUR, self.watcher))
+            self.hour = None
+        if self.hour is None:
+            self.hour = _Bucket(start)
+        self.hour.merge(minute)
+
+
+class LatencyHistory:
+    """
+    Delay history of devices: recent samples in memory (RttRing of every device),
+    per minute and per hour summaries in history db.
+    Summaries are queued by rings from probe threads and written by the writer thread in batches.
+    """
+
+    # Singleton
+    def __new__(cls, *args):
+        if not hasattr(cls, 'instance'):
+            cls.instance = super(LatencyHistory, cls).__new__(cls)
+        return cls.instance
+
+    def __init__(self):
+        if hasattr(self, 'db_path'):
+            return
+        self.logger = logging.getLogger('Latency-History')
+        self.db_path = './res/history.db'
+        self.rings = {}  # id(device): RttRing
+        self.queue = queue.Queue()
+        self.writer = threading.Thread(target=self._write_rows, name="HistoryWriter", daemon=True)
+        self.writer.start()
+
+    def ring(self, device):
+        """
+        :return: samples ring of device (created on first call)
+        """
+        ring = self.rings.get(id(device))
+        if ring is None:
+            ring = self.rings[id(device)] = RttRing(str(device), self.queue.put)
+        return ring
+
+    def release(self, device):
+        """
+        Device is not watched anymore, its summaries are written
+        """
+        ring = self.rings.pop(id(device), None)
+        if ring is not None:
+            ring.flush()
+
+    def query(self, watcher, resolution=MINUTE, since=None, until=None):
+        """
+        Select downsampled history of watcher, oldest first
+        :param watcher: watcher name (str(device))
+        :param resolution: MINUTE or HOUR
+        :param since: timestamp from (included), None - from first summary
+        :param until: timestamp to (excluded), None - to last summary
+        :return: list of rows (start timestamp, samples, online samples, min ms, avg ms, max ms),
+            delays are None if not measured
+        """
+        sql = 'SELECT start, samples, up, rtt_min, rtt_sum / nullif(measured, 0), rtt_max FROM history ' \
+              'WHERE resolution = ? AND watcher = ? AND start >= ? AND start < ? ORDER BY start;'
+        params = (resolution, str(watcher), 0 if since is None else int(since),
+                  2 ** 32 if until is None else int(until))
+        rows = []
+        try:
+            with sqlite3.connect(self.db_path) as db:
+                rows = db.execute(sql, params).fetchall()
+        except sqlite3.Error as e:
+            self.logger.error(e)
+        return rows
+
+    def flush(self):
+        """
+        Wait until queued summaries are written
+        """
+        self.queue.join()
+
+    def close(self):
+        """
+        Write summaries of all rings and stop writer thread
+        """
+        if not self.writer.is_alive():
+            return
+        for ring in list(self.rings.values()):
+            ring.flush()
+        self.queue.put(None)
+        self.writer.join()
+
+    def _create_db(self, db):
+        with db:
+            db.execute('CREATE TABLE IF NOT EXISTS history (resolution INTEGER, watcher TEXT, start INTEGER, '
+                       'samples INTEGER, up INTEGER, measured INTEGER, rtt_min REAL, rtt_sum REAL, rtt_max REAL, '
+                       'PRIMARY KEY (resolution, watcher, start)) WITHOUT ROWID;')
+
+    def _write_rows(self):
+        """
+        Writer thread: waits for summaries, writes all queued ones in one transaction,
+        deletes expired summaries once in PRUNE_INTERVAL
+        """
+        try:
+            db = sqlite3.connect(self.db_path)
+            db.execute('PRAGMA journal_mode=WAL;')
+            db.execute('PRAGMA synchronous=NORMAL;')
+            self._create_db(db)
+        except sqlite3.Error as e:
+            self.logger.error(e)
+            return
+        prune_time = 0
+        stopped = False
+        while not stopped:
+            batch = [self.queue.get()]
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            rows = [row for row in batch if row is not None]
+            stopped = len(rows) < len(batch)
+            try:
+                with db:
+                    # Summary of the same period is merged (watcher restarted within period)
+                    db.executemany('INSERT INTO history VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) '
+                                   'ON CONFLICT (resolution, watcher, start) DO UPDATE SET '
+                                   'samples = samples + excluded.samples, up = up + excluded.up, '
+                                   'measured = measured + excluded.measured, '
+                                   'rtt_min = min(coalesce(rtt_min, excluded.rtt_min), '
+                                   'coalesce(excluded.rtt_min, rtt_min)), '
+                                   'rtt_sum = rtt_sum + excluded.rtt_sum, '
+                                   'rtt_max = max(coalesce(rtt_max, excluded.rtt_max), '
+                                   'coalesce(excluded.rtt_max, rtt_max));', rows)
+                    if time.monotonic() > prune_time:
+                        prune_time = time.monotonic() + PRUNE_INTERVAL
+                        now = time.time()
+                        db.execute('DELETE FROM history WHERE resolution = ? AND start < ?;',
+                                   (MINUTE, now - MINUTE_RETENTION_DAYS * DAY))
+                        db.execute('DELETE FROM history WHERE resolution = ? AND start < ?;',
+                                   (HOUR, now - HOUR_RETENTION_DAYS * DAY))
+            except sqlite3.Error as e:
+                self.logger.error(e)
+            else:
+                self.logger.debug(f'Written {len(rows)} summaries')
+            for _ in batch:
+                self.queue.task_done()
+        db.close()
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import math
+from array import array
+
+# Histogram buckets: delays from MIN_RTT ms, every next bucket is BUCKET_GROWTH times wider (±5% error)
+MIN_RTT = 0.1  # ms
+BUCKET_GROWTH = 1.1
+BUCKETS = 128  # up to ~20 s
+# Weight of every sample is DECAY times less than of the next one (half-life ~350 samples)
+DECAY = 0.998
+# Jitter smoothing (RFC 3550)
+JITTER_GAIN = 1 / 16
+# Loss ratio of last checks
+LOSS_WINDOW = 100
+
+_LOG_GROWTH = math.log(BUCKET_GROWTH)
+# Weights are rescaled before float overflow
+_MAX_WEIGHT = 1e100
+
+
+class LatencyStats:
+    """
+    Streaming statistics of device checks, updated in O(1) per check without storing samples:
+    delay percentiles by a log bucket histogram with exponential decay (recent checks weigh more),
+    EWMA jitter of consecutive delays, loss ratio of last LOSS_WINDOW checks.
+    """
+    __slots__ = ('counts', 'total', 'weight', 'jitter', 'last_rtt', 'window', 'position', 'checks', 'lost',
+                 'version', 'cache')
+
+    def __init__(self):
+        self.counts = array('d', bytes(8 * BUCKETS))
+        self.total = 0.0
+        # Weight of the next sample, grows instead of decaying all buckets
+        self.weight = 1.0
+        self.jitter = None  # ms
+        self.last_rtt = None
+        self.window = bytearray(LOSS_WINDOW)  # 1 - lost check
+        self.position = 0
+        self.checks = 0  # checks in window
+        self.lost = 0  # lost checks in window
+        self.version = 0
+        self.cache = None  # (version, summary)
+
+    def add(self, rtt, online):
+        """
+        :param rtt: delay ms or None if not measured
+        :param online: device answered
+        """
+        self.version += 1
+        lost = 0 if online else 1
+        self.lost += lost - self.window[self.position]
+        self.window[self.position] = lost
+        self.position = (self.position + 1) % LOSS_WINDOW
+        self.checks = min(self.checks + 1, LOSS_WINDOW)
+        if rtt is None:
+            return
+
+        if self.last_rtt is not None:
+            difference = abs(rtt - self.last_rtt)
+            self.jitter = difference if self.jitter is None else \
+                self.jitter + (difference - self.jitter) * JITTER_GAIN
+        self.last_rtt = rtt
+
+        self.counts[self._bucket(rtt)] += self.weight
+        self.total += self.weight
+        self.weight /= DECAY
+        if self.weight > _MAX_WEIGHT:
+            self._rescale()
+
+    def percentile(self, p):
+        """
+        :param p: 0..100
+        :return: delay ms (bucket middle) or None if no delays measured
+        """
+        if self.total <= 0:
+            return None
+        rank = self.total * p / 100
+        accumulated = 0.0
+        for i, count in enumerate(self.counts):
+            accumulated += count
+            if accumulated >= rank and count > 0:
+                return MIN_RTT * BUCKET_GROWTH ** (i + 0.5)
+        return MIN_RTT * BUCKET_GROWTH ** BUCKETS
+
+    @property
+    def loss(self):
+        """
+        :return: lost checks of last LOSS_WINDOW checks, %
+        """
+        return 100 * self.lost / self.checks if self.checks > 0 else 0.0
+
+    def summary(self):
+        """
+        :return: dict p50, p95, p99, jitter (ms or None), loss (%), computed once per new check
+        """
+        if self.cache is not None and self.cache[0] == self.version:
+            return self.cache[1]
+        summary = {
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "jitter": self.jitter,
+            "loss": self.loss
+        }
+        self.cache = (self.version, summary)
+        return summary
+
+    @staticmethod
+    def _bucket(rtt):
+        if rtt <= MIN_RTT:
+            return 0
+        return min(int(math.log(rtt / MIN_RTT) / _LOG_GROWTH), BUCKETS - 1)
+
+    def _rescale(self):
+        """
+        Divide all weights by the next sample weight (rarely, once in ~115000 samples)
+        """
+        for i in range(BUCKETS):
+            self.counts[i] /= self.weight
+        self.total /= self.weight
+        self.weight = 1.0
+
+
+if __name__ == "__main__":
+    pass
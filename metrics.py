@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PREFIX = "netwatchdog_"
+# Delays of devices, ms
+LATENCY_BUCKETS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 3000)
+# Durations of checks and writes, seconds
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 3, 5, 10)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = PREFIX + name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.values = {}  # label values tuple: value
+        self.lock = threading.Lock()
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """
+    Value changed by inc(), or read on scrape by function (counted elsewhere, e.g. in probe engine)
+    """
+    kind = "counter"
+
+    def __init__(self, name, documentation, labels=()):
+        super().__init__(name, documentation, labels)
+        # callable() -> value, or iterable of (label values tuple, value) if labeled
+        self.function = None
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def expose(self):
+        if self.function is None:
+            with self.lock:
+                values = list(self.values.items())
+        else:
+            values = self.function()
+            if len(self.label_names) == 0:
+                values = [((), values)]
+        return self.header() + [f"{self.name}{_labels(self.label_names, labels)} {_number(value)}"
+                                for labels, value in values if value is not None]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value, *labels):
+        with self.lock:
+            self.values[labels] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=DURATION_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        with self.lock:
+            state = self.values.get(labels)
+            if state is None:
+                # Counts of buckets (+Inf last), sum
+                state = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][bisect_left(self.buckets, value)] += 1
+            state[1] += value
+
+    def expose(self):
+        with self.lock:
+            values = [(labels, (list(counts), total)) for labels, (counts, total) in self.values.items()]
+        lines = self.header()
+        for labels, (counts, total) in values:
+            accumulated = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                accumulated += count
+                le = f'le="{bound if bound == "+Inf" else _number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, le)} {accumulated}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {accumulated}")
+        return lines
+
+
+class Metrics:
+    """
+    Registry of metrics, exposed in Prometheus text format.
+    Counters and histograms are updated from any thread (one short lock per update),
+    gauges of devices and queues are computed on scrape only.
+    """
+
+    # Singleton
+    def __new__(cls, *args):
+        if not hasattr(cls, 'instance'):
+            cls.instance = super(Metrics, cls).__new__(cls)
+        return cls.instance
+
+    def __init__(self):
+        if hasattr(self, 'metrics'):
+            return
+        self.logger = logging.getLogger("Metrics")
+        self.metrics = {}  # name: metric
+        self.server = None
+        self.thread = None
+
+    def counter(self, name, documentation, labels=(), function=None):
+        """
+        :param function: value read on scrape, replaced by the next registration (e.g. new WatchManager)
+        """
+        counter = self._register(Counter, name, documentation, labels)
+        if function is not None:
+            counter.function = function
+        return counter
+
+    def gauge(self, name, documentation, labels=(), function=None):
+        """
+        :param function: value computed on scrape, replaced by the next registration
+        """
+        gauge = self._register(Gauge, name, documentation, labels)
+        if function is not None:
+            gauge.function = function
+        return gauge
+
+    def histogram(self, name, documentation, labels=(), buckets=DURATION_BUCKETS):
+        return self._register(Histogram, name, documentation, labels, buckets)
+
+    def _register(self, cls, name, documentation, labels, *args):
+        """
+        :return: registered metric of name, created on first call
+        """
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = self.metrics[name] = cls(name, documentation, labels, *args)
+        return metric
+
+    def expose(self):
+        """
+        :return: all metrics in text exposition format
+        """
+        lines = []
+        for metric in list(self.metrics.values()):
+            try:
+                lines.extend(metric.expose())
+            except Exception as e:
+                self.logger.error(f"{metric.name}: {e}")
+        return "\n".join(lines) + "\n"
+
+    def start_server(self, port, host="127.0.0.1"):
+        """
+        Serve metrics on http://host:port/metrics in background thread
+        """
+        if self.server is not None:
+            return
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = metrics.expose().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                metrics.logger.debug(format % args)
+
+        try:
+            self.server = ThreadingHTTPServer((host, port), Handler)
+        except OSError as e:
+            self.logger.error(f"Metrics server on port {port}: {e}")
+            return
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name="MetricsServer", daemon=True)
+        self.thread.start()
+        self.logger.info(f"Metrics served on http://{host}:{port}/metrics")
+
+    def stop_server(self):
+        if self.server is None:
+            return
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        self.server = None
+        self.thread = None
+
+
+if __name__ == "__main__":
+    pass
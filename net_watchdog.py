@@ -7,6 +7,9 @@ import traceback
 import argparse
 import logging
 import locale
+import multiprocessing
+import span_profile
+from startup_profile import StartupProfiler
 
 APP_NAME = "NetWatcher"
 APP_VER = "1.0.0"
@@ -18,6 +21,8 @@ def excepthook(exc_type, exc_value, exc_tb):
 
 
 if __name__ == "__main__":
+    # Probe worker processes in frozen executable
+    multiprocessing.freeze_support()
     if sys.platform.startswith('win'):
         locale.setlocale(locale.LC_ALL, 'ru_RU')
     else:
@@ -25,7 +30,17 @@ if __name__ == "__main__":
 
     parser = argparse.ArgumentParser(description=f"{APP_NAME} {APP_VER}")
     parser.add_argument("--loglevel", "-l", default="INFO", help="Set the log level (DEBUG, INFO, WARNING, ...)")
+    parser.add_argument("--headless", action="store_true", help="Run watchers without GUI, write journal only")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="Print import time and init phases breakdown to stderr")
+    parser.add_argument("--profile", action="store_true",
+                        help=f"Write checks, journal and UI spans per cycle to {span_profile.REPORT_FILE}")
+    parser.add_argument("--import", dest="import_file", metavar="FILE",
+                        help="Add devices of CSV / JSON / JSON Lines file to inventory and exit")
+    parser.add_argument("--export", dest="export_file", metavar="FILE",
+                        help="Write devices of inventory to CSV / JSON / JSON Lines file and exit")
     args = parser.parse_args()
+    profiler = StartupProfiler(args.profile_startup)
 
     file_handler = logging.FileHandler('NetWatchdog.log', mode='w')
     stdout_handler = logging.StreamHandler()
@@ -40,17 +55,51 @@ if __name__ == "__main__":
 
     logger = logging.getLogger(__name__)
     logger.info(f"Start {APP_NAME} {APP_VER}")
+    # Before the profiled modules are imported
+    if args.profile:
+        span_profile.enable()
 
-    from ui import main_win
-    from PyQt5.QtWidgets import QApplication, QStyleFactory
+    if args.import_file or args.export_file:
+        from inventory_db import Inventory
+        try:
+            if args.import_file:
+                imported, invalid = Inventory().import_file(args.import_file)
+                print(f"Imported {imported} devices, invalid records: {invalid}")
+            if args.export_file:
+                print(f"Exported {Inventory().export_file(args.export_file)} devices")
+        except (OSError, ValueError) as e:
+            logger.error(e)
+            sys.exit(1)
+        sys.exit(0)
+
+    if args.headless:
+        with profiler.phase("import headless"):
+            from headless import HeadlessWatchdog
+        with profiler.phase("load watchers"):
+            watchdog = HeadlessWatchdog()
+        profiler.report("Headless startup")
+        exit_code = watchdog.run()
+        span_profile.disable()
+        sys.exit(exit_code)
+
+    with profiler.phase("import ui"):
+        from ui import main_win
+        from PyQt5.QtWidgets import QApplication, QStyleFactory
+        from PyQt5.QtCore import QTimer
 
     sys.excepthook = excepthook
-    app = QApplication(sys.argv)
-    if "Fusion" in QStyleFactory.keys():
-        app.setStyle("Fusion")
-    main_w = main_win.MainWin()
-    main_w.show()
+    with profiler.phase("QApplication"):
+        app = QApplication(sys.argv)
+        if "Fusion" in QStyleFactory.keys():
+            app.setStyle("Fusion")
+    with profiler.phase("MainWin"):
+        main_w = main_win.MainWin()
+    with profiler.phase("show"):
+        main_w.show()
+    # Reported when the event loop has started (first window painted)
+    QTimer.singleShot(0, profiler.report)
     app_ret_code = app.exec_()
+    span_profile.disable()
 
     # Clear tmp dir
     tmp_dir = os.path.join(os.curdir, "tmp")
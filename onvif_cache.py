@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import copy
+import logging
+from threading import Lock, RLock
+from onvif import ONVIFCamera, ONVIFService, ONVIFError
+from onvif.client import UsernameDigestTokenDtDiff
+from zeep.cache import SqliteCache
+from zeep.client import Client, Settings
+from zeep.transports import Transport
+
+CACHE_FILE = "./res/onvif_cache.db"
+CACHE_TIMEOUT = 30 * 24 * 3600  # seconds
+
+
+class OnvifClientCache:
+    """
+    Process-wide cache of parsed ONVIF WSDL documents.
+    Every WSDL is parsed once, cameras get a shallow copy of the
+    template zeep client with their own credentials.
+    """
+
+    # Singleton, first used by many probe threads at once
+    init_lock = Lock()
+
+    def __new__(cls, *args):
+        if not hasattr(cls, 'instance'):
+            cls.instance = super(OnvifClientCache, cls).__new__(cls)
+        return cls.instance
+
+    def __init__(self):
+        with self.init_lock:
+            if hasattr(self, 'clients'):
+                return
+            self.logger = logging.getLogger('OnvifClientCache')
+            self.lock = RLock()
+            # Documents loaded over HTTP (imported schemas) are persisted on disk
+            try:
+                cache = SqliteCache(path=CACHE_FILE, timeout=CACHE_TIMEOUT)
+            except Exception as e:
+                self.logger.error(e)
+                cache = None
+            self.transport = Transport(cache=cache)
+            # Set last: initialized
+            self.clients = {}  # WSDL file: template zeep client
+
+    def client(self, wsdl_file, wsse):
+        """
+        :param wsdl_file: path to WSDL file
+        :param wsse: camera credentials (zeep wsse object)
+        :return: zeep client
+        """
+        with self.lock:
+            template = self.clients.get(wsdl_file)
+            if template is None:
+                self.logger.debug(f'Parse {wsdl_file} ...')
+                settings = Settings()
+                settings.strict = False
+                settings.xml_huge_tree = True
+                template = Client(wsdl=wsdl_file, transport=self.transport, settings=settings)
+                self.clients[wsdl_file] = template
+        client = copy.copy(template)
+        client.wsse = wsse
+        return client
+
+
+class CachedONVIFCamera(ONVIFCamera):
+    """
+    ONVIFCamera which builds service clients from OnvifClientCache
+    """
+
+    def create_onvif_service(self, name, from_template=True, portType=None):
+        name = name.lower()
+        xaddr, wsdl_file, binding_name = self.get_definition(name, portType)
+        wsse = UsernameDigestTokenDtDiff(self.user, self.passwd, dt_diff=self.dt_diff, use_digest=self.encrypt)
+        try:
+            zeep_client = OnvifClientCache().client(wsdl_file, wsse)
+        except Exception as e:
+            raise ONVIFError(e)
+        with self.services_lock:
+            service = ONVIFService(xaddr, self.user, self.passwd, wsdl_file, self.encrypt, self.daemon,
+                                   zeep_client=zeep_client, portType=portType, dt_diff=self.dt_diff,
+                                   binding_name=binding_name)
+            self.services[name] = service
+            setattr(self, name, service)
+        return service
+
+
+if __name__ == "__main__":
+    pass
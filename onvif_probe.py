@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import http.client
+import logging
+import time
+from threading import Lock
+from xml.etree.ElementTree import XMLPullParser, ParseError
+
+DEVICE_SERVICE = "/onvif/device_service"
+DEFAULT_HTTP_PORT = 80
+# Idle connections kept per camera
+POOL_SIZE = 2
+READ_CHUNK = 4096
+
+# GetSystemDateAndTime does not need authentication (ONVIF Core spec)
+GET_SYSTEM_DATE_AND_TIME = (
+    b'<?xml version="1.0" encoding="UTF-8"?>'
+    b'<s:Envelope xmlns:s="http://www.w3.org/2003/05/soap-envelope">'
+    b'<s:Body xmlns:tds="http://www.onvif.org/ver10/device/wsdl"><tds:GetSystemDateAndTime/></s:Body>'
+    b'</s:Envelope>'
+)
+HEADERS = {
+    "Content-Type": 'application/soap+xml; charset=utf-8; '
+                    'action="http://www.onvif.org/ver10/device/wsdl/GetSystemDateAndTime"',
+    "Connection": "keep-alive",
+}
+# Elements which prove that device answered by SOAP
+ANSWER_TAGS = ("GetSystemDateAndTimeResponse", "Fault")
+
+
+class OnvifProbePool:
+    """
+    Light ONVIF liveness check: pre-serialized GetSystemDateAndTime request
+    over per-camera keep-alive HTTP connections
+    """
+
+    # Singleton
+    def __new__(cls, *args):
+        if not hasattr(cls, 'instance'):
+            cls.instance = super(OnvifProbePool, cls).__new__(cls)
+        return cls.instance
+
+    def __init__(self):
+        if hasattr(self, 'pool'):
+            return
+        self.logger = logging.getLogger('OnvifProbePool')
+        self.lock = Lock()
+        self.pool = {}  # (host, port): [idle HTTPConnection]
+
+    def probe(self, host, port, timeout):
+        """
+        :return: response delay ms or None if device not answered
+        """
+        key = (host, int(port) or DEFAULT_HTTP_PORT)
+        with self.lock:
+            idle = self.pool.get(key)
+            conn = idle.pop() if idle else None
+        reused = conn is not None
+        if conn is None:
+            conn = http.client.HTTPConnection(*key, timeout=timeout)
+        start = time.monotonic()
+        try:
+            try:
+                conn.request("POST", DEVICE_SERVICE, GET_SYSTEM_DATE_AND_TIME, HEADERS)
+                response = conn.getresponse()
+            except (OSError, http.client.HTTPException) as e:
+                if not reused:
+                    raise
+                # Idle connection was closed by camera, retry once on new connection
+                self.logger.debug(f"{host}: pooled connection failed ({e!r}), reconnect")
+                conn.close()
+                conn = http.client.HTTPConnection(*key, timeout=timeout)
+                start = time.monotonic()
+                conn.request("POST", DEVICE_SERVICE, GET_SYSTEM_DATE_AND_TIME, HEADERS)
+                response = conn.getresponse()
+            answered = self._answered(response)
+        except (OSError, http.client.HTTPException) as e:
+            self.logger.debug(f"{host}: {e}")
+            conn.close()
+            return None
+        delay = (time.monotonic() - start) * 1000
+        if response.will_close or not response.isclosed():
+            conn.close()
+        else:
+            with self.lock:
+                idle = self.pool.setdefault(key, [])
+                if len(idle) < POOL_SIZE:
+                    idle.append(conn)
+                    conn = None
+            if conn is not None:
+                conn.close()
+        return delay if answered else None
+
+    @staticmethod
+    def _answered(response):
+        """
+        Stream response body to parser, looking for answer element only
+        """
+        parser = XMLPullParser(events=("end",))
+        answered = False
+        try:
+            while True:
+                chunk = response.read(READ_CHUNK)
+                if not chunk:
+                    break
+                if answered:
+                    # Read rest of body, to reuse connection
+                    continue
+                parser.feed(chunk)
+                for _, element in parser.read_events():
+                    if element.tag.rpartition("}")[2] in ANSWER_TAGS:
+                        answered = True
+                        break
+        except ParseError:
+            return False
+        return answered
+
+    def close(self, host, port):
+        """
+        Close idle connections of camera
+        """
+        with self.lock:
+            idle = self.pool.pop((host, int(port) or DEFAULT_HTTP_PORT), [])
+        for conn in idle:
+            conn.close()
+
+
+if __name__ == "__main__":
+    import sys
+    print(OnvifProbePool().probe(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 80, 3))
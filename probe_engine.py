@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from watch_manager import WatchMethod
+from device import PROBE_TIMEOUT
+from icmp_sweep import IcmpSweeper
+from tcp_sweep import TcpSweeper
+from scheduler import ProbeScheduler, DEFAULT_INTERVAL
+from metrics import Metrics, LATENCY_BUCKETS
+import span_profile
+
+DEFAULT_CONCURRENCY = 64
+# Devices due within this window are checked in one batch (one ICMP/TCP sweep), seconds
+BATCH_WINDOW = 0.25
+
+PROBES = Metrics().counter("probes_total", "Device checks by result", ("method", "result"))
+PROBE_LATENCY = Metrics().histogram("probe_latency_ms", "Delay of answered devices, ms", ("method",),
+                                    LATENCY_BUCKETS)
+PROBE_DURATION = Metrics().histogram("probe_duration_seconds", "Device check duration, from start to result",
+                                     ("method",))
+SWEEP_DURATION = Metrics().histogram("sweep_duration_seconds", "ICMP / TCP sweep of a batch duration",
+                                     ("method",))
+BATCH_DEVICES = Metrics().histogram("batch_devices", "Devices checked in one batch", (),
+                                 (1, 10, 100, 1000, 10000))
+
+
+def observe_result(device, duration=None):
+    """
+    Count check result in metrics
+    :param duration: check duration, seconds (None if unknown)
+    """
+    method = device.watch_method.name
+    PROBES.inc(method, "up" if bool(device.online_stat) else "down")
+    if device.rtt is not None:
+        PROBE_LATENCY.observe(device.rtt, method)
+    if duration is not None:
+        PROBE_DURATION.observe(duration, method)
+
+
+class ProbeEngine:
+    """
+    Checks devices on one asyncio event loop, running in a background thread.
+    Every device is checked on its own schedule (see ProbeScheduler).
+    Results are reported through callbacks, invoked from the engine thread:
+        on_started(device) - device check started
+        on_result(device) - device checked, device.online_stat updated
+    """
+
+    def __init__(self, concurrency=DEFAULT_CONCURRENCY, interval=DEFAULT_INTERVAL, on_started=None,
+                 on_result=None):
+        """
+        :param concurrency: max count of devices checked at the same time
+        :param interval: default check interval, seconds
+        """
+        self.logger = logging.getLogger("ProbeEngine")
+        self.concurrency = max(1, int(concurrency))
+        self.on_started = on_started
+        self.on_result = on_result
+        self.loop = None
+        self.thread = None
+        self.executor = None
+        self.wakeup = None
+        self.stopping = False
+        self.scheduler = ProbeScheduler(interval)
+        self.in_flight = {}  # id(device): check start time
+        self.icmp = IcmpSweeper()
+        self.tcp = TcpSweeper()
+
+    @property
+    def missed_deadlines(self):
+        return self.scheduler.missed
+
+    def start(self):
+        """
+        Start event loop thread
+        """
+        if self.thread is not None:
+            return
+        self.loop = asyncio.new_event_loop()
+        self.stopping = False
+        # Blocking checks (ONVIF, sweeps) are limited by the same concurrency
+        self.executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="Probe")
+        self.loop.set_default_executor(self.executor)
+        self.thread = threading.Thread(target=self._run_loop, name="ProbeEngine", daemon=True)
+        self.thread.start()
+        self.logger.info(f"Probe engine started, concurrency: {self.concurrency}")
+
+    def stop(self):
+        """
+        Stop event loop thread and wait for it
+        """
+        if self.thread is None:
+            return
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.executor.shutdown(wait=False)
+        self.thread = None
+        self.logger.info("Probe engine stopped")
+
+    def watch(self, device):
+        """
+        Add device to schedule (or move existing one), device is checked immediately
+        """
+        self._call(self.scheduler.add, device)
+
+    def unwatch(self, device):
+        """
+        Remove device from schedule
+        """
+        self._call(self.scheduler.remove, device)
+
+    def set_interval(self, interval):
+        """
+        :param interval: default check interval, seconds
+        """
+        self._call(setattr, self.scheduler, 'interval', interval)
+
+    def _call(self, func, *args):
+        """
+        Invoke func in engine thread (scheduler is not thread safe)
+        """
+        if self.thread is None:
+            func(*args)
+        else:
+            self.loop.call_soon_threadsafe(self._call_and_wakeup, func, *args)
+
+    def _call_and_wakeup(self, func, *args):
+        func(*args)
+        self.wakeup.set()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.wakeup = asyncio.Event()
+        self.loop.create_task(self._schedule())
+        try:
+            self.loop.run_forever()
+        finally:
+            # wait_for() may swallow cancellation when wakeup is set at the same time
+            self.stopping = True
+            tasks = asyncio.all_tasks(self.loop)
+            for task in tasks:
+                task.cancel()
+            self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self.loop.close()
+
+    async def _schedule(self):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        while not self.stopping:
+            batch = []
+            for device in self.scheduler.pop_due(time.monotonic() + BATCH_WINDOW):
+                if id(device) in self.in_flight:
+                    # Previous check still working
+                    self.scheduler.missed += 1
+                    self.scheduler.reschedule(device)
+                elif not device.watched:
+                    device.trigger_count = 0
+                    self.scheduler.reschedule(device)
+                else:
+                    batch.append(device)
+            if len(batch) > 0:
+                self._dispatch(batch, semaphore)
+                BATCH_DEVICES.observe(len(batch))
+            self.wakeup.clear()
+            next_due = self.scheduler.next_due()
+            timeout = None if next_due is None else max(next_due - time.monotonic(), 0)
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _dispatch(self, devices, semaphore):
+        """
+        Start checks of devices, slow checks never delay the next batches
+        """
+        start = time.monotonic()
+        for device in devices:
+            self.in_flight[id(device)] = start
+            if self.on_started is not None:
+                self.on_started(device)
+        # All PING devices of batch are checked by one ICMP sweep
+        if self.icmp.available():
+            pings = [device for device in devices if device.watch_method == WatchMethod.PING]
+            if len(pings) > 0:
+                self.loop.create_task(self._ping_sweep(pings))
+                devices = [device for device in devices if device.watch_method != WatchMethod.PING]
+        # All PORT devices of batch are checked by one TCP connect sweep
+        ports = [device for device in devices if device.watch_method == WatchMethod.PORT]
+        if len(ports) > 0:
+            self.loop.create_task(self._port_sweep(ports))
+            devices = [device for device in devices if device.watch_method != WatchMethod.PORT]
+        for device in devices:
+            self.loop.create_task(self._probe_device(device, semaphore))
+
+    async def _probe_device(self, device, semaphore):
+        async with semaphore:
+            try:
+                await self.loop.run_in_executor(None, device.is_online)
+            except Exception as e:
+                self.logger.error(f"{device}: {e}")
+                device.update_online_stat(None)
+        self._report(device)
+
+    async def _ping_sweep(self, devices):
+        start = time.monotonic()
+        try:
+            delays = await self.loop.run_in_executor(
+                None, self.icmp.sweep, [device.ip for device in devices], PROBE_TIMEOUT)
+        except OSError as e:
+            self.logger.error(f"ICMP sweep: {e}")
+            delays = {}
+        elapsed = time.monotonic() - start
+        SWEEP_DURATION.observe(elapsed, WatchMethod.PING.name)
+        self._record_spans(devices, [delays.get(device.ip) for device in devices], elapsed)
+        for device in devices:
+            device.update_online_stat(delays.get(device.ip))
+            self._report(device)
+
+    async def _port_sweep(self, devices):
+        start = time.monotonic()
+        try:
+            delays = await self.loop.run_in_executor(
+                None, self.tcp.sweep, [(device.ip, device.port) for device in devices], PROBE_TIMEOUT)
+        except OSError as e:
+            self.logger.error(f"TCP sweep: {e}")
+            delays = {}
+        elapsed = time.monotonic() - start
+        SWEEP_DURATION.observe(elapsed, WatchMethod.PORT.name)
+        self._record_spans(devices, [delays.get((device.ip, device.port)) for device in devices], elapsed)
+        for device in devices:
+            device.update_online_stat(delays.get((device.ip, device.port)))
+            self._report(device)
+
+    @staticmethod
+    def _record_spans(devices, delays, elapsed):
+        """
+        Swept devices are not checked by Device.is_online: their delays are "probe" spans of profiling
+        :param delays: delay ms or None (not answered) of every device
+        :param elapsed: sweep duration, seconds (span of not answered devices)
+        """
+        if not span_profile.enabled():
+            return
+        for device, delay in zip(devices, delays):
+            span_profile.record("probe", elapsed if delay is None else delay / 1000, device)
+
+    def _report(self, device):
+        start = self.in_flight.pop(id(device), None)
+        observe_result(device, None if start is None else time.monotonic() - start)
+        self.scheduler.reschedule(device, checked=True)
+        # Next due time may be earlier than the scheduler waits for
+        self.wakeup.set()
+        if self.on_result is not None:
+            self.on_result(device)
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import heapq
+import itertools
+import random
+import time
+
+DEFAULT_INTERVAL = 5  # seconds
+# Check interval is spread randomly by +-JITTER of interval
+JITTER = 0.1
+# Exponential backoff starts after this count of failed checks in a row
+BACKOFF_AFTER = 5
+# Max check interval of long-dead devices, seconds
+MAX_INTERVAL = 300
+# Check started later than due time + LATE_TOLERANCE is a missed deadline, seconds
+LATE_TOLERANCE = 1
+
+
+class ProbeScheduler:
+    """
+    Heap of devices keyed by next due time.
+    Every device has its own interval (Device.interval or scheduler default),
+    with exponential backoff for dead devices and random jitter.
+    """
+
+    def __init__(self, interval=DEFAULT_INTERVAL):
+        self.interval = interval
+        self.heap = []  # (due time, seq, device)
+        self.devices = {}  # id(device): device
+        self.entries = {}  # id(device): seq of actual heap entry
+        self.failures = {}  # id(device): failed checks in a row
+        self.counter = itertools.count()
+        self.missed = 0
+
+    def __len__(self):
+        return len(self.devices)
+
+    def __contains__(self, device):
+        return id(device) in self.devices
+
+    def add(self, device, delay=0.0):
+        """
+        Add device or move its next check
+        :param delay: seconds to next check
+        """
+        key = id(device)
+        self.devices[key] = device
+        seq = next(self.counter)
+        self.entries[key] = seq
+        heapq.heappush(self.heap, (time.monotonic() + delay, seq, device))
+
+    def remove(self, device):
+        key = id(device)
+        self.devices.pop(key, None)
+        self.entries.pop(key, None)
+        self.failures.pop(key, None)
+
+    def pop_due(self, until):
+        """
+        :param until: monotonic time
+        :return: list of devices due until this time
+        """
+        now = time.monotonic()
+        due = []
+        while self.heap and self.heap[0][0] <= until:
+            due_time, seq, device = heapq.heappop(self.heap)
+            if self.entries.get(id(device)) != seq:
+                # Removed or rescheduled
+                continue
+            del self.entries[id(device)]
+            if due_time < now - LATE_TOLERANCE:
+                self.missed += 1
+            due.append(device)
+        return due
+
+    def next_due(self):
+        """
+        :return: monotonic time of next check or None
+        """
+        while self.heap and self.entries.get(id(self.heap[0][2])) != self.heap[0][1]:
+            heapq.heappop(self.heap)
+        return self.heap[0][0] if self.heap else None
+
+    def next_interval(self, device):
+        """
+        :return: seconds to next check of device
+        """
+        interval = getattr(device, 'interval', 0) or self.interval
+        failures = self.failures.get(id(device), 0)
+        if failures > BACKOFF_AFTER:
+            backoff = interval * 2 ** min(failures - BACKOFF_AFTER, 16)
+            interval = max(interval, min(backoff, MAX_INTERVAL))
+        return interval * random.uniform(1 - JITTER, 1 + JITTER)
+
+    def reschedule(self, device, checked=False):
+        """
+        Schedule next check of device
+        :param checked: device is rescheduled on result of its check, failures are counted by fresh online_stat
+            (not on missed deadline, online_stat of previous check may be stale)
+        """
+        key = id(device)
+        if key not in self.devices:
+            return
+        if not device.watched:
+            self.failures.pop(key, None)
+        elif checked:
+            if bool(device.online_stat):
+                self.failures.pop(key, None)
+            else:
+                self.failures[key] = self.failures.get(key, 0) + 1
+        self.add(device, self.next_interval(device))
+
+if __name__ == "__main__":
+    pass
@@ -1,10 +1,14 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import os
 import sys
+import tempfile
+import threading
 from configparser import *
 import logging
 from os.path import exists
+from typing import NamedTuple, Optional
 
 GENERAL_SECTION = "General"
 SETTINGS_FILE = "./settings.ini"
@@ -14,6 +18,11 @@ UPDATE_TIMEOUT = "update_timeout"
 CHECK_COUNT_TO_ALARM = "check_count_to_alarm"
 SORT_BY_LAG_TIME = "sort_by_lag_time"
 NOTIFY_SOUND = "notify_sound"
+PROBE_CONCURRENCY = "probe_concurrency"
+SNAPSHOT_INTERVAL = "snapshot_interval"
+PROBE_PROCESSES = "probe_processes"
+JOURNAL_RETENTION_DAYS = "journal_retention_days"
+METRICS_PORT = "metrics_port"
 
 # Main window
 MAIN_WINDOW_WIDTH = "main_win_w"
@@ -21,10 +30,45 @@ MAIN_WINDOW_HEIGHT = "main_win_h"
 MAIN_WINDOW_X = "main_win_x"
 MAIN_WINDOW_Y = "main_win_y"
 
+# Debounce of save(), seconds
+SAVE_DELAY = 1.0
+
+
+class GeneralSettings(NamedTuple):
+    """
+    Typed snapshot of General section, field names are setting keys.
+    Missing or invalid values are replaced by defaults.
+    """
+    update_timeout: int = 5
+    check_count_to_alarm: int = 2
+    sort_by_lag_time: int = 2
+    notify_sound: int = 2
+    probe_concurrency: int = 64
+    snapshot_interval: int = 60
+    probe_processes: int = 0
+    journal_retention_days: int = 365
+    metrics_port: int = 0
+    main_win_w: Optional[int] = None
+    main_win_h: Optional[int] = None
+    main_win_x: Optional[int] = None
+    main_win_y: Optional[int] = None
+
+    @classmethod
+    def from_config(cls, config):
+        values = {}
+        for key, default in cls._field_defaults.items():
+            try:
+                values[key] = int(config.get(GENERAL_SECTION, key))
+            except (NoSectionError, NoOptionError, ValueError):
+                values[key] = default
+        return cls(**values)
+
 
 class Settings:
     """
     :return settings object
+    Typed values of General section are read from snapshot (refreshed on write only),
+    subscribers are notified on changes of snapshot.
     """
     def __init__(self, file=SETTINGS_FILE):
         """
@@ -38,7 +82,12 @@ class Settings:
         self.config = ConfigParser()
         self.sections = []
         self.watchers = []
-        if not exists(SETTINGS_FILE):
+        self.snapshot = GeneralSettings()
+        self.subscribers = []  # callable(snapshot, changed keys)
+        # Config is written by GUI thread and saved by save timer thread
+        self.lock = threading.RLock()
+        self.save_timer = None
+        if not exists(file):
             self.write_default_settings()
         self.read_settings()
         self.logger.info('Init new settings')
@@ -55,12 +104,13 @@ class Settings:
         :return: None
         """
         try:
-            with open(self.file, "r") as f:
+            with open(self.file, "r") as f, self.lock:
                 self.config.read_file(f)
-            self.sections = self.config.sections()
-            self.watchers = list(
-                filter(lambda item: str(item).startswith("WatchMethod."), self.config.sections())
-            )
+                self.sections = self.config.sections()
+                self.watchers = list(
+                    filter(lambda item: str(item).startswith("WatchMethod."), self.config.sections())
+                )
+            self._update_snapshot()
         except FileNotFoundError:
             self.logger.error("File:", SETTINGS_FILE, "not found, write settings first!", file=sys.stderr)
 
@@ -69,48 +119,94 @@ class Settings:
         :param key: String key
         :param value: String value
         """
-        if not self.config.has_section(GENERAL_SECTION):
-            self.config.add_section(GENERAL_SECTION)
-        self.config[GENERAL_SECTION][key] = str(value)
-        self.sections = self.config.sections()
+        with self.lock:
+            if not self.config.has_section(GENERAL_SECTION):
+                self.config.add_section(GENERAL_SECTION)
+            elif self.config.get(GENERAL_SECTION, key, fallback=None) == str(value):
+                return
+            self.config[GENERAL_SECTION][key] = str(value)
+            self.sections = self.config.sections()
+        if key in GeneralSettings._fields:
+            self._update_snapshot()
 
     def read(self, key):
         return self.config.get(GENERAL_SECTION, key)
 
-    def write_watcher(self, watcher):
+    def subscribe(self, callback):
         """
-        :param watcher: WatchFrame object
-        :param values_dict: Watcher values (dict)
+        :param callback: callable(snapshot, changed keys), invoked by the thread which changed settings
         """
-        watcher_config = {
-            "watch_method": str(watcher.device.watch_method.value),
-            "watch_for": str(watcher.device.watch_for.value),
-            "ip": watcher.device.ip,
-            "user": watcher.device.user,
-            "password": watcher.device.password,
-            "port": str(watcher.device.port),
-            "watched": str(watcher.device.watched)
-        }
-        self.config[str(watcher.device)] = watcher_config
-        self.watchers = list(
-            filter(lambda item: str(item).startswith("WatchMethod."), self.config.sections())
-        )
-
-    def read_watcher_conf(self, watcher_section):
+        self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self.subscribers:
+            self.subscribers.remove(callback)
+
+    def _update_snapshot(self):
+        with self.lock:
+            snapshot = GeneralSettings.from_config(self.config)
+            old, self.snapshot = self.snapshot, snapshot
+        changed = {key for key, value, old_value in zip(snapshot._fields, snapshot, old) if value != old_value}
+        if len(changed) == 0:
+            return
+        for callback in list(self.subscribers):
+            try:
+                callback(snapshot, changed)
+            except Exception as e:
+                self.logger.error(f"Settings subscriber: {e}")
+
+    def remove_watcher(self, watcher_section):
         """
+        Watchers are kept in inventory, sections of previous versions are removed when moved
         :param watcher_section: Name of watcher section in settings file
-        :return: watcher configuration list()
         """
-        return dict(self.config[watcher_section]).values()
+        with self.lock:
+            self.config.remove_section(watcher_section)
+            self.sections = self.config.sections()
+            if watcher_section in self.watchers:
+                self.watchers.remove(watcher_section)
 
     def write_settings(self):
         """
-        Write settings to file
+        Write settings to file now: to temp file, then replace settings file (never left half written)
         """
-        with open(self.file, "w") as f:
-            self.config.write(f)
+        with self.lock:
+            if self.save_timer is not None:
+                self.save_timer.cancel()
+                self.save_timer = None
+            directory = os.path.dirname(os.path.abspath(self.file))
+            fd, temp_file = tempfile.mkstemp(prefix=".settings-", suffix=".tmp", dir=directory)
+            try:
+                with os.fdopen(fd, "w") as f:
+                    self.config.write(f)
+                    f.flush()
+                    os.fsync(f.fileno())
+                # Temp file is created readable by owner only
+                os.chmod(temp_file, os.stat(self.file).st_mode if exists(self.file) else 0o644)
+                os.replace(temp_file, self.file)
+            except OSError:
+                if exists(temp_file):
+                    os.remove(temp_file)
+                raise
         self.logger.info(f'Settings write to {self.file}')
 
+    def save(self):
+        """
+        Write settings to file in SAVE_DELAY seconds, next save() calls within delay are written once
+        """
+        with self.lock:
+            if self.save_timer is not None:
+                self.save_timer.cancel()
+            self.save_timer = threading.Timer(SAVE_DELAY, self._save_later)
+            self.save_timer.daemon = True
+            self.save_timer.start()
+
+    def _save_later(self):
+        try:
+            self.write_settings()
+        except OSError as e:
+            self.logger.error(e)
+
     def write_default_settings(self):
         """ Init default settings"""
         self.logger.info('Write default settings...')
@@ -118,6 +214,12 @@ class Settings:
         self.write(CHECK_COUNT_TO_ALARM, '2')
         self.write(SORT_BY_LAG_TIME, '2')
         self.write(NOTIFY_SOUND, '2')
+        self.write(PROBE_CONCURRENCY, '64')
+        self.write(SNAPSHOT_INTERVAL, '60')
+        self.write(PROBE_PROCESSES, '0')
+        self.write(JOURNAL_RETENTION_DAYS, '365')
+        # 0 - metrics endpoint disabled
+        self.write(METRICS_PORT, '0')
         self.write_settings()
 
 
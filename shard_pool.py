@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+import math
+import queue
+import struct
+import threading
+import itertools
+import zlib
+import multiprocessing
+from multiprocessing import shared_memory
+from types import SimpleNamespace
+from watch_manager import WatchMethod
+from probe_engine import observe_result
+
+# Devices per worker process
+SHARD_CAPACITY = 65536
+# Results ring size (slot indexes) per worker
+RING_SIZE = 65536
+POLL_INTERVAL = 0.05  # seconds
+# Shared memory layout of shard:
+#   header: int64 events written (ring head), int64 missed deadlines
+#   ring: int32[RING_SIZE] events: slot - check result, -slot - 1 - check started
+#   results: float64[SHARD_CAPACITY] delay ms, NaN - device offline
+#   sequences: int64[SHARD_CAPACITY] seqlock of slot result: odd while written, +2 per result
+#   generations: int64[SHARD_CAPACITY] generation of device the slot result (or start) belongs to
+HEADER = struct.Struct("qq")
+RING_OFFSET = HEADER.size
+RESULTS_OFFSET = RING_OFFSET + 4 * RING_SIZE
+SEQUENCES_OFFSET = RESULTS_OFFSET + 8 * SHARD_CAPACITY
+GENERATIONS_OFFSET = SEQUENCES_OFFSET + 8 * SHARD_CAPACITY
+SHM_SIZE = GENERATIONS_OFFSET + 8 * SHARD_CAPACITY
+# Shown until ONVIF info of online device received from worker
+UNKNOWN_ONVIF_INFO = SimpleNamespace(Manufacturer="", Model="", FirmwareVersion="")
+
+
+def shard_of(device, shards):
+    """
+    Stable (between runs) shard index of device
+    """
+    return zlib.crc32(str(device).encode()) % shards
+
+
+class _Shard:
+    """
+    Coordinator side of worker process
+    """
+
+    def __init__(self, ctx, index, concurrency, interval, infos):
+        self.shm = shared_memory.SharedMemory(create=True, size=SHM_SIZE)
+        self.header = self.shm.buf[:RING_OFFSET].cast("q")
+        self.ring = self.shm.buf[RING_OFFSET:RESULTS_OFFSET].cast("i")
+        self.results = self.shm.buf[RESULTS_OFFSET:SEQUENCES_OFFSET].cast("d")
+        self.sequences = self.shm.buf[SEQUENCES_OFFSET:GENERATIONS_OFFSET].cast("q")
+        self.generations = self.shm.buf[GENERATIONS_OFFSET:SHM_SIZE].cast("q")
+        self.header[0] = 0
+        self.header[1] = 0
+        self.tail = 0
+        self.closed_missed = None
+        self.devices = {}  # slot: device
+        # Slot is reused right after unwatch: results of the previous device are told apart by generation
+        self.generation = {}  # slot: generation of device
+        self.applied = {}  # slot: sequence of the last applied result
+        self.free = list(reversed(range(SHARD_CAPACITY)))
+        self.commands = ctx.Queue()
+        self.process = ctx.Process(target=_worker_main, name=f"ProbeShard-{index}", daemon=True,
+                                   args=(index, self.shm.name, self.commands, infos, concurrency, interval))
+
+    def missed(self):
+        return self.header[1] if self.closed_missed is None else self.closed_missed
+
+    def close(self):
+        self.closed_missed = self.header[1]
+        self.header.release()
+        self.ring.release()
+        self.results.release()
+        self.sequences.release()
+        self.generations.release()
+        self.shm.close()
+        self.shm.unlink()
+
+
+class ShardedProbeEngine:
+    """
+    Checks devices in N worker processes, each running its own ProbeEngine.
+    Devices are split by a stable hash of str(device), workers write check
+    results to shared memory, so results are not pickled per check.
+    Has the same interface as ProbeEngine, callbacks are invoked from the poll thread.
+    """
+
+    def __init__(self, processes, concurrency, interval, on_started=None, on_result=None):
+        self.logger = logging.getLogger("ShardedProbeEngine")
+        self.on_started = on_started
+        self.on_result = on_result
+        ctx = multiprocessing.get_context("spawn")
+        # ONVIF device info changes rarely, it is pickled
+        self.infos = ctx.Queue()
+        self.shards = [_Shard(ctx, index, concurrency, interval, self.infos) for index in range(max(1, processes))]
+        self.slots = {}  # id(device): (shard, slot)
+        self.generations = itertools.count(1)
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stopped = threading.Event()
+
+    @property
+    def missed_deadlines(self):
+        return sum(shard.missed() for shard in self.shards)
+
+    def start(self):
+        """
+        Start worker processes, devices added before start are sent to them from queues
+        """
+        if self.thread is not None:
+            return
+        for shard in self.shards:
+            shard.process.start()
+        self.thread = threading.Thread(target=self._poll, name="ShardedProbeEngine", daemon=True)
+        self.thread.start()
+        self.logger.info(f"Started {len(self.shards)} probe processes")
+
+    def stop(self):
+        if self.thread is None:
+            return
+        self.stopped.set()
+        self.thread.join()
+        self.thread = None
+        for shard in self.shards:
+            shard.commands.put(None)
+        for shard in self.shards:
+            shard.process.join(5)
+            if shard.process.is_alive():
+                shard.process.terminate()
+            shard.close()
+        self.logger.info("Probe processes stopped")
+
+    def watch(self, device):
+        """
+        Add device (or update its config), device is checked immediately
+        """
+        with self.lock:
+            position = self.slots.get(id(device))
+            if position is None:
+                shard = self.shards[shard_of(device, len(self.shards))]
+                slot = shard.free.pop()
+                shard.generation[slot] = next(self.generations)
+                shard.applied[slot] = shard.sequences[slot]
+                self.slots[id(device)] = (shard, slot)
+            else:
+                shard, slot = position
+            shard.devices[slot] = device
+            shard.commands.put(("watch", slot, shard.generation[slot], device.get_config()))
+
+    def unwatch(self, device):
+        with self.lock:
+            position = self.slots.pop(id(device), None)
+            if position is None:
+                return
+            shard, slot = position
+            shard.devices.pop(slot, None)
+            shard.generation.pop(slot, None)
+            shard.applied.pop(slot, None)
+            shard.free.append(slot)
+            shard.commands.put(("unwatch", slot))
+
+    def set_interval(self, interval):
+        for shard in self.shards:
+            shard.commands.put(("interval", interval))
+
+    def _poll(self):
+        while not self.stopped.wait(POLL_INTERVAL):
+            self._read_infos()
+            for shard in self.shards:
+                self._read_results(shard)
+
+    def _read_infos(self):
+        while True:
+            try:
+                shard_index, slot, generation, info = self.infos.get_nowait()
+            except queue.Empty:
+                return
+            shard = self.shards[shard_index]
+            device = shard.devices.get(slot)
+            if device is not None and shard.generation.get(slot) == generation:
+                device.onvif_info = SimpleNamespace(**info)
+
+    def _read_results(self, shard):
+        head = shard.header[0]
+        if head == shard.tail:
+            return
+        events = []  # (device, None) - check started, (device, delay) - checked, in order of ring
+        with self.lock:
+            if head - shard.tail > RING_SIZE:
+                # Ring overrun: started events are lost, results of slots written since last read are applied
+                ring = list(shard.devices)
+            else:
+                ring = [shard.ring[index % RING_SIZE] for index in range(shard.tail, head)]
+            for event in ring:
+                slot = event if event >= 0 else -event - 1
+                device = shard.devices.get(slot)
+                if device is None:
+                    continue
+                if event < 0:
+                    # Start of device removed from slot is skipped
+                    if shard.generations[slot] == shard.generation[slot]:
+                        events.append((device, None))
+                    continue
+                # Seqlock: sequence is odd while worker writes result, result read during write is skipped
+                # (its event is in ring after this head)
+                sequence = shard.sequences[slot]
+                if sequence % 2 == 1 or sequence == shard.applied[slot]:
+                    # Result is applied once, even if slot is in ring several times
+                    continue
+                generation = shard.generations[slot]
+                delay = shard.results[slot]
+                if shard.sequences[slot] != sequence:
+                    continue
+                shard.applied[slot] = sequence
+                # Result of device removed from slot is skipped
+                if generation == shard.generation[slot]:
+                    events.append((device, delay))
+        shard.tail = head
+        for device, delay in events:
+            if delay is not None:
+                self._apply(device, delay)
+            elif self.on_started is not None:
+                self.on_started(device)
+
+    def _apply(self, device, delay):
+        if not device.watched:
+            device.trigger_count = 0
+            return
+        if math.isnan(delay):
+            stat = None
+        elif device.watch_method == WatchMethod.ONVIF:
+            stat = device.onvif_info or UNKNOWN_ONVIF_INFO
+        else:
+            stat = delay
+        device.update_online_stat(stat, measured=False)
+        # Check duration is known by worker only
+        observe_result(device)
+        if self.on_result is not None:
+            self.on_result(device)
+
+
+def _worker_main(index, shm_name, commands, infos, concurrency, interval):
+    """
+    Worker process: checks devices of one shard by ProbeEngine
+    """
+    from device import Device
+    from probe_engine import ProbeEngine
+
+    logger = logging.getLogger(f"ProbeShard-{index}")
+    # Shared memory is owned (and unlinked) by coordinator
+    shm = shared_memory.SharedMemory(name=shm_name)
+    header = shm.buf[:RING_OFFSET].cast("q")
+    ring = shm.buf[RING_OFFSET:RESULTS_OFFSET].cast("i")
+    results = shm.buf[RESULTS_OFFSET:SEQUENCES_OFFSET].cast("d")
+    sequences = shm.buf[SEQUENCES_OFFSET:GENERATIONS_OFFSET].cast("q")
+    generations = shm.buf[GENERATIONS_OFFSET:SHM_SIZE].cast("q")
+    devices = {}  # slot: Device
+    slots = {}  # id(Device): slot
+    device_generations = {}  # slot: generation of device
+    info_times = {}  # slot: time of last sent ONVIF info
+    lock = threading.Lock()
+
+    def write_event(slot, event):
+        head = header[0]
+        ring[head % RING_SIZE] = event
+        header[0] = head + 1
+
+    def on_started(device):
+        with lock:
+            slot = slots.get(id(device))
+            if slot is None:
+                return
+            generations[slot] = device_generations[slot]
+            write_event(slot, -slot - 1)
+
+    def on_result(device):
+        with lock:
+            slot = slots.get(id(device))
+            if slot is None:
+                return
+            if device.watch_method == WatchMethod.ONVIF and info_times.get(slot) != device.onvif_info_time \
+                    and device.onvif_info is not None:
+                info_times[slot] = device.onvif_info_time
+                info = {name: getattr(device.onvif_info, name, "") for name in
+                        ("Manufacturer", "Model", "FirmwareVersion", "SerialNumber", "HardwareId")}
+                infos.put((index, slot, device_generations[slot], info))
+            # Odd sequence while result is written (seqlock)
+            sequences[slot] += 1
+            if isinstance(device.online_stat, (int, float)):
+                results[slot] = device.online_stat
+            else:
+                results[slot] = 1.0 if bool(device.online_stat) else math.nan
+            generations[slot] = device_generations[slot]
+            sequences[slot] += 1
+            write_event(slot, slot)
+            header[1] = engine.missed_deadlines
+
+    engine = ProbeEngine(concurrency, interval, on_started=on_started, on_result=on_result)
+    engine.start()
+    try:
+        while True:
+            command = commands.get()
+            if command is None:
+                break
+            if command[0] == "watch":
+                _, slot, generation, config = command
+                device = Device(*config.values())
+                with lock:
+                    old = devices.get(slot)
+                    if old is not None:
+                        engine.unwatch(old)
+                        slots.pop(id(old), None)
+                    devices[slot] = device
+                    slots[id(device)] = slot
+                    device_generations[slot] = generation
+                    info_times.pop(slot, None)
+                engine.watch(device)
+            elif command[0] == "unwatch":
+                with lock:
+                    device = devices.pop(command[1], None)
+                    if device is not None:
+                        slots.pop(id(device), None)
+                if device is not None:
+                    engine.unwatch(device)
+            elif command[0] == "interval":
+                engine.set_interval(command[1])
+    except KeyboardInterrupt:
+        pass
+    finally:
+        engine.stop()
+        header.release()
+        ring.release()
+        results.release()
+        sequences.release()
+        generations.release()
+        shm.close()
+        logger.debug("Worker stopped")
+
+
+if __name__ == "__main__":
+    pass
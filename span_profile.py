@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import nullcontext
+from functools import wraps
+
+# Report of every cycle
+CYCLE_INTERVAL = 10  # seconds
+REPORT_FILE = "./profile.log"
+# Reports kept in file
+REPORT_CYCLES = 30
+TOP_SUBJECTS = 10
+TOP_ALLOCATIONS = 10
+
+# SpanProfiler, set by enable() (--profile)
+_profiler = None
+_null_span = nullcontext()
+
+
+def enable(report_file=REPORT_FILE, interval=CYCLE_INTERVAL):
+    """
+    Start span profiling, must be called before profiled modules are imported:
+    functions decorated by @profiled are wrapped at import time only if profiling enabled
+    """
+    global _profiler
+    if _profiler is None:
+        _profiler = SpanProfiler(report_file, interval)
+        _profiler.start()
+    return _profiler
+
+
+def disable():
+    """
+    Write the last report and stop profiling (wrapped functions stay wrapped, spans are ignored)
+    """
+    global _profiler
+    if _profiler is not None:
+        _profiler.stop()
+        _profiler = None
+
+
+def profiled(stage, subject=None):
+    """
+    Decorator: every call is a span of stage.
+    Without profiling function is returned as is (no overhead).
+    :param subject: index of argument spans are grouped by (e.g. device), None - stage only
+    """
+    def decorate(func):
+        if _profiler is None:
+            return func
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profiler = _profiler
+                if profiler is not None:
+                    profiler.add(stage, time.perf_counter() - start,
+                                 None if subject is None or subject >= len(args) else args[subject])
+        return wrapper
+    return decorate
+
+
+def enabled():
+    return _profiler is not None
+
+
+def record(stage, seconds, subject=None):
+    """
+    Add span measured elsewhere (e.g. delay of host in sweep), ignored without profiling
+    """
+    profiler = _profiler
+    if profiler is not None:
+        profiler.add(stage, seconds, subject)
+
+
+def span(stage, subject=None):
+    """
+    Context manager of code block span, shared no-op context without profiling
+    """
+    if _profiler is None:
+        return _null_span
+    return _Span(_profiler, stage, subject)
+
+
+class _Span:
+    __slots__ = ('profiler', 'stage', 'subject', 'start')
+
+    def __init__(self, profiler, stage, subject):
+        self.profiler = profiler
+        self.stage = stage
+        self.subject = subject
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.add(self.stage, time.perf_counter() - self.start, self.subject)
+        return False
+
+
+class SpanProfiler:
+    """
+    Aggregates spans of stages (checks, ONVIF requests, snapshots, journal, UI rebuild) per cycle.
+    Every cycle report (time by stage, slowest subjects, allocation deltas by tracemalloc)
+    is added to rolling report file by reporter thread.
+    """
+
+    def __init__(self, report_file=REPORT_FILE, interval=CYCLE_INTERVAL):
+        self.logger = logging.getLogger("SpanProfiler")
+        self.report_file = report_file
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.stages = {}  # stage: [count, total seconds, max seconds]
+        self.subjects = {}  # (stage, subject): [count, total seconds, max seconds]
+        self.reports = deque(maxlen=REPORT_CYCLES)
+        self.cycle = 0
+        self.cycle_start = time.perf_counter()
+        self.snapshot = None
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.snapshot = tracemalloc.take_snapshot()
+        self.cycle_start = time.perf_counter()
+        self.thread = threading.Thread(target=self._run, name="SpanProfiler", daemon=True)
+        self.thread.start()
+        self.logger.info(f"Span profiling, report: {self.report_file}")
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.report()
+        tracemalloc.stop()
+
+    def add(self, stage, seconds, subject=None):
+        with self.lock:
+            stat = self.stages.get(stage)
+            if stat is None:
+                stat = self.stages[stage] = [0, 0.0, 0.0]
+            stat[0] += 1
+            stat[1] += seconds
+            stat[2] = max(stat[2], seconds)
+            if subject is not None:
+                key = (stage, str(subject))
+                stat = self.subjects.get(key)
+                if stat is None:
+                    stat = self.subjects[key] = [0, 0.0, 0.0]
+                stat[0] += 1
+                stat[1] += seconds
+                stat[2] = max(stat[2], seconds)
+
+    def report(self):
+        """
+        Close cycle: add its report to rolling report file
+        """
+        with self.lock:
+            stages, self.stages = self.stages, {}
+            subjects, self.subjects = self.subjects, {}
+        now = time.perf_counter()
+        duration, self.cycle_start = now - self.cycle_start, now
+        self.cycle += 1
+
+        lines = [f"Cycle {self.cycle} ({time.strftime('%d-%b-%Y %H:%M:%S')}), {duration:.1f} s"]
+        lines.append(f"  {'spans':>7}  {'total ms':>10}  {'avg ms':>8}  {'max ms':>8}  stage")
+        for stage, (count, total, longest) in sorted(stages.items(), key=lambda item: item[1][1], reverse=True):
+            lines.append(f"  {count:7d}  {total * 1000:10.1f}  {total * 1000 / count:8.2f}  "
+                         f"{longest * 1000:8.1f}  {stage}")
+        if len(subjects) > 0:
+            lines.append(f"Slowest (by max span):")
+            slowest = sorted(subjects.items(), key=lambda item: item[1][2], reverse=True)[:TOP_SUBJECTS]
+            for (stage, subject), (count, total, longest) in slowest:
+                lines.append(f"  {count:7d}  {total * 1000:10.1f}  {total * 1000 / count:8.2f}  "
+                             f"{longest * 1000:8.1f}  {stage}: {subject}")
+        if tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot().filter_traces(
+                (tracemalloc.Filter(False, tracemalloc.__file__),))
+            current, peak = tracemalloc.get_traced_memory()
+            lines.append(f"Allocations: {current / 1024 / 1024:.1f} MB (peak {peak / 1024 / 1024:.1f} MB), "
+                         f"top changes:")
+            for stat in snapshot.compare_to(self.snapshot, "lineno")[:TOP_ALLOCATIONS]:
+                lines.append(f"  {stat.size_diff / 1024:+10.1f} KB  {stat.count_diff:+8d}  {stat.traceback}")
+            self.snapshot = snapshot
+        self.reports.append("\n".join(lines))
+        try:
+            with open(self.report_file, "w", encoding="utf-8") as f:
+                f.write("\n\n".join(reversed(self.reports)) + "\n")
+        except OSError as e:
+            self.logger.error(e)
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.report()
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import sys
+import time
+from contextlib import contextmanager
+from importlib.abc import MetaPathFinder
+
+# Count of slowest imports in report
+REPORT_IMPORTS = 25
+
+
+class ImportTimer(MetaPathFinder):
+    """
+    Measures execution time of every imported module.
+    Inserted first into sys.meta_path, finds module spec by the next finders
+    and wraps exec_module() of its loader.
+    """
+
+    def __init__(self):
+        self.times = {}  # module name: (cumulative ms, self ms)
+        self.stack = []  # [module name, start time, children ms]
+        self.finding = False
+
+    def install(self):
+        sys.meta_path.insert(0, self)
+
+    def uninstall(self):
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    def find_spec(self, name, path, target=None):
+        if self.finding:
+            return None
+        self.finding = True
+        try:
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, 'find_spec'):
+                    continue
+                spec = finder.find_spec(name, path, target)
+                if spec is not None:
+                    break
+            else:
+                return None
+        finally:
+            self.finding = False
+        loader = spec.loader
+        # Builtin and frozen importers are shared classes, not per module loaders
+        if loader is None or isinstance(loader, type) or not hasattr(loader, 'exec_module'):
+            return spec
+        exec_module = loader.exec_module
+
+        def timed_exec_module(module):
+            self.stack.append([name, time.perf_counter(), 0.0])
+            try:
+                exec_module(module)
+            finally:
+                _, start, children = self.stack.pop()
+                cumulative = (time.perf_counter() - start) * 1000
+                self.times[name] = (cumulative, cumulative - children)
+                if self.stack:
+                    self.stack[-1][2] += cumulative
+
+        loader.exec_module = timed_exec_module
+        return spec
+
+
+class StartupProfiler:
+    """
+    Import time and init phases breakdown (--profile-startup), does nothing when disabled
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.start = time.perf_counter()
+        self.phases = []  # (name, ms)
+        self.imports = ImportTimer()
+        if enabled:
+            self.imports.install()
+
+    @contextmanager
+    def phase(self, name):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, (time.perf_counter() - start) * 1000))
+
+    def report(self, title="Startup"):
+        """
+        Print breakdown to stderr and stop measuring imports
+        """
+        if not self.enabled:
+            return
+        self.imports.uninstall()
+        total = (time.perf_counter() - self.start) * 1000
+        lines = [f"{title} profile, total: {total:.1f} ms", "Phases (ms):"]
+        for name, ms in self.phases:
+            lines.append(f"  {ms:9.1f}  {name}")
+        times = self.imports.times
+        lines.append(f"Imports: {len(times)} modules, {sum(t[1] for t in times.values()):.1f} ms")
+        lines.append(f"  {'cumul. ms':>9}  {'self ms':>9}  module")
+        slowest = sorted(times.items(), key=lambda item: item[1][0], reverse=True)[:REPORT_IMPORTS]
+        for name, (cumulative, own) in slowest:
+            lines.append(f"  {cumulative:9.1f}  {own:9.1f}  {name}")
+        print("\n".join(lines), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    pass
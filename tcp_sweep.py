@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import errno
+import socket
+import struct
+import logging
+import selectors
+import time
+from span_profile import profiled
+
+try:
+    import resource
+except ImportError:
+    # Windows
+    resource = None
+
+# l_onoff=1, l_linger=0: close() sends RST, socket does not stay in TIME_WAIT
+LINGER_RST = struct.pack("ii", 1, 0)
+# File descriptors left for the rest of the application
+RESERVED_FDS = 128
+MAX_IN_FLIGHT = 10000
+
+
+def raise_fd_limit():
+    """
+    Raise soft limit of open files up to hard limit
+    :return: soft limit of open files
+    """
+    if resource is None:
+        return 512 + RESERVED_FDS
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or soft < hard:
+        try:
+            wanted = MAX_IN_FLIGHT + RESERVED_FDS
+            if hard != resource.RLIM_INFINITY:
+                wanted = min(wanted, hard)
+            if wanted > soft:
+                resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+                soft = wanted
+        except (ValueError, OSError):
+            pass
+    return soft
+
+
+class TcpSweeper:
+    """
+    Starts non-blocking TCP connects to many host:port pairs at once
+    and waits for them with selectors (epoll on Linux).
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger("TcpSweeper")
+        self.max_in_flight = max(1, min(MAX_IN_FLIGHT, raise_fd_limit() - RESERVED_FDS))
+
+    @profiled("tcp sweep")
+    def sweep(self, targets, timeout):
+        """
+        Connect to all targets
+        :param targets: iterable of (host, port)
+        :param timeout: seconds to wait for every connect
+        :return: dict {(host, port): connect delay ms or None}
+        """
+        results = dict.fromkeys(targets)
+        # Connects beyond max_in_flight start as soon as earlier ones finish
+        pending = list(reversed(list(results)))
+        in_flight = {}  # fd: (target, socket, start time)
+        selector = selectors.DefaultSelector()
+        try:
+            while pending or in_flight:
+                while pending and len(in_flight) < self.max_in_flight:
+                    self._connect(pending.pop(), selector, in_flight, results)
+                if not in_flight:
+                    continue
+                # in_flight keeps connect order, so the first one is the oldest
+                _, _, oldest = next(iter(in_flight.values()))
+                for key, _ in selector.select(max(oldest + timeout - time.monotonic(), 0)):
+                    self._finish(key.fd, selector, in_flight, results)
+                # Drop timed out connects
+                deadline = time.monotonic() - timeout
+                expired = []
+                for fd, (_, _, start) in in_flight.items():
+                    if start > deadline:
+                        break
+                    expired.append(fd)
+                for fd in expired:
+                    self._close(fd, selector, in_flight)
+        finally:
+            for fd in list(in_flight):
+                self._close(fd, selector, in_flight)
+            selector.close()
+        return results
+
+    def _connect(self, target, selector, in_flight, results):
+        sock = None
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setblocking(False)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, LINGER_RST)
+            address = (socket.gethostbyname(target[0]), int(target[1]))
+            start = time.monotonic()
+            err = sock.connect_ex(address)
+        except OSError as e:
+            self.logger.debug(f"{target}: {e}")
+            if sock is not None:
+                sock.close()
+            return
+        if err == 0:
+            results[target] = (time.monotonic() - start) * 1000
+            sock.close()
+        elif err in (errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EAGAIN):
+            in_flight[sock.fileno()] = (target, sock, start)
+            selector.register(sock, selectors.EVENT_WRITE)
+        else:
+            sock.close()
+
+    def _finish(self, fd, selector, in_flight, results):
+        target, sock, start = in_flight[fd]
+        if sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) == 0:
+            results[target] = (time.monotonic() - start) * 1000
+        self._close(fd, selector, in_flight)
+
+    @staticmethod
+    def _close(fd, selector, in_flight):
+        _, sock, _ = in_flight.pop(fd)
+        selector.unregister(sock)
+        sock.close()
+
+
+if __name__ == "__main__":
+    import sys
+    print(TcpSweeper().sweep([tuple(arg.split(":")) for arg in sys.argv[1:]], 3))
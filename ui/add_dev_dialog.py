@@ -3,7 +3,7 @@
 
 from PyQt5.Qt import QDialog, QApplication, QStackedWidget, QLineEdit, QMessageBox
 from PyQt5.QtCore import Qt
-from PyQt5.uic import loadUi
+from ui.resources import load_ui
 from watch_manager import WatchFor, WatchMethod
 from device import Device
 import re
@@ -14,7 +14,7 @@ import logging
 class AddDevDialog(QDialog):
     def __init__(self, add_dev_callback, parent):
         super().__init__(parent)
-        loadUi("ui/add_dev_dialog.ui", self)
+        load_ui("ui/add_dev_dialog.ui", self)
 
         self.logger = logging.getLogger("AddDevDialog")
         self.add_dev_callback = add_dev_callback
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+from datetime import datetime
+from functools import lru_cache
+from pytz import timezone
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex
+from journal_db import JournalDb
+
+PAGE_LIMIT = 100
+# More new records than this reload the first page instead of prepending
+MAX_PREPEND = 10000
+TZ = 'Europe/Kiev'
+
+tz = timezone(TZ)
+
+
+@lru_cache(maxsize=4096)
+def format_timestamp(timestamp):
+    """
+    :param timestamp: UTC seconds (int)
+    :return: local date time string
+    """
+    return tz.fromutc(datetime.fromtimestamp(timestamp)).strftime('%c')
+
+
+class JournalModel(QAbstractTableModel):
+    """
+    Journal records, newest first.
+    Records are fetched from JournalDb by pages when view scrolls (canFetchMore/fetchMore),
+    new records are prepended by prepend_new().
+    """
+    columns = ['Дата время', 'Наблюдатель', 'Событие', 'Сообщение']
+
+    def __init__(self, journal: JournalDb, parent=None):
+        super().__init__(parent)
+        self.logger = logging.getLogger('Journal-Model')
+        self.journal = journal
+        self.records = []  # (id, timestamp, watcher, event, msg)
+        self.at_end = False
+        self.newest_id = None  # max id of shown records
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.records)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.columns)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.columns[section]
+        return super().headerData(section, orientation, role)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or not index.isValid():
+            return None
+        record = self.records[index.row()]
+        if index.column() == 0:
+            # Formatted for visible cells only
+            return format_timestamp(int(record[1]))
+        return str(record[index.column() + 1])
+
+    def flags(self, index):
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self.at_end
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self.at_end:
+            return
+        before = (self.records[-1][1], self.records[-1][0]) if len(self.records) > 0 else None
+        records = self.journal.query(before=before, limit=PAGE_LIMIT)
+        self.at_end = len(records) < PAGE_LIMIT
+        if len(records) == 0:
+            return
+        row = len(self.records)
+        self._update_newest_id(records)
+        self.beginInsertRows(QModelIndex(), row, row + len(records) - 1)
+        self.records.extend(records)
+        self.endInsertRows()
+        self.logger.debug(f'Fetched {len(records)} records')
+
+    def prepend_new(self):
+        """
+        Insert records added to journal after the newest shown record
+        """
+        if self.newest_id is None:
+            self.at_end = False
+            self.fetchMore()
+            return
+        records = self.journal.query(after_id=self.newest_id, limit=MAX_PREPEND)
+        if len(records) == 0:
+            return
+        if len(records) == MAX_PREPEND:
+            # Too many new records, show the first page again
+            self.beginResetModel()
+            self.records = []
+            self.at_end = False
+            self.newest_id = None
+            self.endResetModel()
+            self.fetchMore()
+            return
+        self._update_newest_id(records)
+        self.beginInsertRows(QModelIndex(), 0, len(records) - 1)
+        self.records[0:0] = records
+        self.endInsertRows()
+        self.logger.debug(f'Prepended {len(records)} new records')
+
+    def _update_newest_id(self, records):
+        newest_id = max(record[0] for record in records)
+        if self.newest_id is None or newest_id > self.newest_id:
+            self.newest_id = newest_id
+
+
+if __name__ == "__main__":
+    pass
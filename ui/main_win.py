@@ -1,20 +1,18 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-from PyQt5.QtCore import QThread, Qt, QTimer, QRect, QSize
+from PyQt5.QtCore import QThread, Qt, QTimer, QRect, QSize, QObject, pyqtSignal
 from PyQt5.QtWidgets import QMainWindow, QLabel, QMessageBox
-from PyQt5 import uic
 from PyQt5.QtGui import QFont, QIcon, QResizeEvent, QShowEvent
 from PyQt5.uic.properties import QtGui
 
 from settings import *
 from watch_manager import *
-from ui.list_item import WatchFrame
+from ui.watch_model import WatchListModel
+from ui.watch_delegate import WatchDelegate
+from ui import resources
 from device import Device
-from ui.add_dev_dialog import AddDevDialog
-from ui.journal import Journal
-from ui.settings import SettingsDialog
-from playsound import playsound
+from span_profile import profiled
 from os.path import abspath
 import platform
 
@@ -32,20 +30,19 @@ class MainWin(QMainWindow):
         self.settings = Settings()
 
         self.logger = logging.getLogger("MainWin")
-        self.update_threads_pool = []
 
         # PlaySound Thread
         self.playsound_thread = PlayAudioThread()
         self.notify_sound = False
 
-        uic.loadUi('ui/main_win.ui', self)
+        resources.load_ui('ui/main_win.ui', self)
 
-        self.setWindowIcon(QIcon("./res/icons/radar.png"))
-        self.add_dev_btn.setIcon(QIcon("./res/icons/+.png"))
-        self.open_journal_btn.setIcon(QIcon("./res/icons/paste.png"))
-        self.open_settings_btn.setIcon(QIcon("./res/icons/config.png"))
+        self.setWindowIcon(resources.icon("radar.png"))
+        self.add_dev_btn.setIcon(resources.icon("+.png"))
+        self.open_journal_btn.setIcon(resources.icon("paste.png"))
+        self.open_settings_btn.setIcon(resources.icon("config.png"))
 
-        self.emptyLabel = QLabel()
+        self.emptyLabel = QLabel(self.watchers_view.viewport())
         self.emptyLabel.setTextFormat(Qt.RichText)
         self.emptyLabel.setFont(QFont('Arial', 16))
         self.emptyLabel.setFixedSize(int(self.size().width() / 1.4), int(self.size().height() / 1.2))
@@ -67,153 +64,160 @@ class MainWin(QMainWindow):
         # Create WatchManager
         self.WM = WatchManager(self)
 
+        # Watchers list
+        self.model = WatchListModel(self.WM, self)
+        self.delegate = WatchDelegate(self)
+        self.delegate.toggled.connect(lambda w: self.model.set_enabled(w, not w.enabled))
+        self.delegate.delete_requested.connect(self.del_watcher)
+        self.watchers_view.setModel(self.model)
+        self.watchers_view.setItemDelegate(self.delegate)
+        self.model.rowsInserted.connect(self.update_empty_label)
+        self.model.rowsRemoved.connect(self.update_empty_label)
+        self.model.modelReset.connect(self.update_empty_label)
+
+        # Probe engine results, delivered to GUI thread
+        self.probe_signals = ProbeSignals()
+        self.probe_signals.device_started.connect(self.device_started)
+        self.probe_signals.device_probed.connect(self.device_probed)
+        self.WM.engine.on_started = self.probe_signals.device_started.emit
+        self.WM.engine.on_result = self.probe_signals.device_probed.emit
+
+        # Rebuild watchers list once for a burst of check results
+        self.rebuild_timer = QTimer(self)
+        self.rebuild_timer.setSingleShot(True)
+        self.rebuild_timer.setInterval(250)
+        self.rebuild_timer.timeout.connect(self.build_watchers_list)
+
         # Create update timer
         self.timer = QTimer(self)
         # Set default interval
         self.timer.setInterval(5*1000)
-        self.timer.timeout.connect(self.update_watcher_list)
+        self.timer.timeout.connect(self.model.update_delays)
+        self.timer.timeout.connect(self.build_watchers_list)
         self.timer.start()
 
-        if len(self.settings.watchers) == 0:
-            self.vLayoutList.addWidget(self.emptyLabel)
-
         self.load_config()
+        self.WM.engine.start()
 
-        self.update_watcher_list()
         # To display disabled watchers
         self.build_watchers_list()
 
     def read_general_settings(self):
-        try:
-            timeout = int(self.settings.read(UPDATE_TIMEOUT))
-        except NoOptionError or ValueError:
-            timeout = 5
-            self.settings.write(UPDATE_TIMEOUT, timeout)
+        general = self.settings.snapshot
         self.timer.stop()
-        self.timer.setInterval(timeout*1000)
+        self.timer.setInterval(general.update_timeout*1000)
         self.timer.start()
-
-        try:
-            self.notify_sound = bool(int(self.settings.read('notify_sound')))
-        except NoOptionError or ValueError:
-            self.notify_sound = True
-            
+        self.WM.engine.set_interval(general.update_timeout)
+        self.notify_sound = bool(general.notify_sound)
         self.logger.debug("General settings readed")
 
+    # Invoked when general settings changed (e.g. by SettingsDialog)
+    def general_settings_changed(self, general, changed):
+        if UPDATE_TIMEOUT in changed or NOTIFY_SOUND in changed:
+            self.read_general_settings()
+
     def showEvent(self, evt: QShowEvent):
         """Set geometry on showEvent"""
-        try:
-            x = self.settings.read(MAIN_WINDOW_X)
-            y = self.settings.read(MAIN_WINDOW_Y)
-            w = self.settings.read(MAIN_WINDOW_WIDTH)
-            h = self.settings.read(MAIN_WINDOW_HEIGHT)
-            self.setGeometry(int(x), int(y), int(w), int(h))
-            self.resize(int(w), int(h))
-        except Exception as e:
-            self.logger.error(e)
+        general = self.settings.snapshot
+        if None in (general.main_win_x, general.main_win_y, general.main_win_w, general.main_win_h):
+            return
+        self.setGeometry(general.main_win_x, general.main_win_y, general.main_win_w, general.main_win_h)
+        self.resize(general.main_win_w, general.main_win_h)
 
+    # Dialogs are loaded when opened
     def open_journal(self):
+        from ui.journal import Journal
         Journal(self)
 
     def open_settings(self):
+        from ui.settings import SettingsDialog
         SettingsDialog(self)
 
-    def update_watcher_list(self):
-        """
-        Update watchers list in different threads
-        """
-        if len(self.update_threads_pool) > 0:
-            self.logger.debug('Threads still working, wait ...')
-            return
-        for w in self.WM.watchers:
-            if w.enabled:
-                update_thread = UpdateDevicesThread(w)
-                update_thread.finished.connect(self.update_thread_finished)
-                self.update_threads_pool.append(update_thread)
-                update_thread.start()
-            else:
-                w.device.trigger_count = 0
+    # Invoked when device check is started by probe engine
+    def device_started(self, device):
+        if self.model.contains(device):
+            self.model.set_loading(device, True)
 
-    # Invoked when thread is finished
-    def update_thread_finished(self):
-        for thread in self.update_threads_pool:
-            if thread.isFinished():
-                self.update_threads_pool.remove(thread)
-                self.logger.debug(f'Thread {thread.objectName()} finished and removed')
-        if len(self.update_threads_pool) == 0:
-            self.build_watchers_list()
+    # Invoked when device is checked by probe engine
+    def device_probed(self, device):
+        # Result of removed watcher
+        if not self.model.contains(device):
+            return
+        self.model.set_loading(device, False)
+        self.logger.debug(f"{device} online_stat (ms): {device.online_stat}")
+        if self.model.mark_changed(device) and not self.rebuild_timer.isActive():
+            self.rebuild_timer.start()
 
     def add_dev_btn_click(self):
+        from ui.add_dev_dialog import AddDevDialog
         AddDevDialog(self.add_dev, parent=self).show()
 
     def add_dev(self, dev):
         self.logger.debug(f"Add watcher: {dev}")
         # Check if watcher already exists
-        for w in self.WM.watchers:
-            if w.device == dev:
-                QMessageBox.warning(self, 'Добавить наблюдатель',
-                                    'Такой наблюдатель уже в списке!')
-                return
-        # Remove emptyLabel from watchers list
-        if self.vLayoutList.count() == 1 and type(self.vLayoutList.itemAt(0).widget()) is QLabel:
-            self.vLayoutList.removeWidget(self.vLayoutList.itemAt(0).widget())
-        wf = WatchFrame(dev, self.WM)
-        self.WM.add_watch(wf)
-        self.vLayoutList.addWidget(wf)
-        self.update_watcher_list()
-
-    def save_config(self):
-        for w in self.WM.watchers:
-            self.settings.write_watcher(w)
+        if self.WM.find(dev) is not None or not self.WM.inventory.add(dev.get_config()):
+            QMessageBox.warning(self, 'Добавить наблюдатель',
+                                'Такой наблюдатель уже в списке!')
+            return
+        self.model.add(Watcher(dev))
+        self.build_watchers_list()
+
+    # Close/delete watcher
+    def del_watcher(self, w):
+        ret = QMessageBox.question(self, "Удаление наблюдателя",
+                                   f"Удалить наблюдатель за {w.device.ip} ?",
+                                   QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+        if ret == QMessageBox.No:
+            return
+        self.model.remove(w)
+        self.logger.debug(f"Watcher {w.device} removed.")
+
+    def update_empty_label(self):
+        self.emptyLabel.setVisible(self.model.rowCount() == 0)
+
+    def save_config(self, delayed=False):
+        """
+        :param delayed: debounced write of settings file, False - write now
+        """
+        # Watchers are written to inventory on change
         self.settings.write(MAIN_WINDOW_X, str(self.geometry().x()))
         self.settings.write(MAIN_WINDOW_Y, str(self.geometry().y()))
         self.settings.write(MAIN_WINDOW_HEIGHT, str(self.height()))
         self.settings.write(MAIN_WINDOW_WIDTH, str(self.width()))
-        self.settings.write_settings()
-
-    def _update_watcher(self, w):
-        """
-        Invoke from UpdateDevThread
-        :param w: update watcher state
-        """
-        self.logger.debug(f"Update watcher: {w.device}")
-        self.WM.update_info(w)
+        if delayed:
+            self.settings.save()
+        else:
+            self.settings.write_settings()
 
+    @profiled("ui rebuild")
     def build_watchers_list(self):
-        if self.settings.read(SORT_BY_LAG_TIME) != '0':
-            self.WM.watchers.sort(key=WatchManager.sort_by_active)
-        for wf, index in zip(self.WM.watchers, range(0, len(self.WM.watchers))):
-            self._update_watcher(wf)
-            if index < self.vLayoutList.count() and self.vLayoutList.itemAt(index).widget() is not wf:
-                tmp_widget = self.vLayoutList.itemAt(index).widget()
-                self.vLayoutList.removeWidget(tmp_widget)
-                self.vLayoutList.insertWidget(index, wf)
-                self.vLayoutList.addWidget(tmp_widget)
-            elif index >= self.vLayoutList.count():
-                self.vLayoutList.addWidget(wf)
-        # Initialize ALARM by trigger count
-        triggers = int(self.settings.read('check_count_to_alarm'))
-        if not isinstance(triggers, int):
-            triggers = 1
-            self.settings.write('check_count_to_alarm', str(triggers))
-        alarm = False
-        for w in self.WM.watchers:
-            if w.device.trigger_count >= triggers:
-                self.logger.debug(f"{w.device_title_lb.text()} - TRIGGER ALARM ({w.device.trigger_count})")
-                alarm = True
+        # Only watchers changed since last build are updated
+        for device in self.model.update_order(self.settings.snapshot.sort_by_lag_time != 0):
+            w = self.WM.watcher(device)
+            if w is not None:
+                self.WM.check_trigger(w)
+        # ALARM by trigger count
+        alarm = len(self.model.alarmed) > 0
+        if alarm and self.logger.isEnabledFor(logging.DEBUG):
+            for key in self.model.alarmed:
+                w = self.WM.by_device.get(key)
+                if w is None:
+                    continue
+                self.logger.debug(f"{w.device} - TRIGGER ALARM ({w.device.trigger_count})")
         # Play alarm
         if alarm and self.notify_sound:
             self.playsound_thread.start()
 
     def load_config(self):
-        for watcher in self.settings.watchers:
-            watcher_conf = self.settings.read_watcher_conf(watcher)
-            wf = WatchFrame(Device(*watcher_conf), self.WM)
-            self.WM.watchers.append(wf)
+        watchers = [Watcher(Device(*config)) for config in self.WM.inventory.devices()]
+        self.model.load(watchers)
         self.read_general_settings()
+        self.settings.subscribe(self.general_settings_changed)
 
     # Save settings on close main window
     def closeEvent(self, evt):
+        self.settings.unsubscribe(self.general_settings_changed)
+        self.WM.stop()
         try:
             self.save_config()
         except Exception as e:
@@ -223,40 +227,25 @@ class MainWin(QMainWindow):
     # Save settings on hide main window
     def hideEvent(self, evt):
         try:
-            self.save_config()
+            self.save_config(delayed=True)
         except Exception as e:
             print(e.with_traceback())
         evt.accept()
 
     def resizeEvent(self, evt: QResizeEvent):
-        size = QSize(self.scrollArea.width(), self.size().height()-20)
-        self.scrollArea.resize(size)
+        size = QSize(self.watchers_view.width(), self.size().height()-20)
+        self.watchers_view.resize(size)
         rect: QRect = self.settings_frame.geometry()
         self.settings_frame.setGeometry(rect.x(), self.geometry().height() - rect.height(),
                                         rect.width(), rect.height())
 
 
-class UpdateDevicesThread(QThread):
+class ProbeSignals(QObject):
     """
-    Used for network requests
+    Delivers probe engine callbacks to GUI thread
     """
-
-    def __init__(self, w: WatchFrame):
-        super().__init__()
-        self.w = w
-        self.setObjectName('QThread-' + str(w.device))
-        self.logger = logging.getLogger(self.objectName())
-
-    def run(self):
-        self.logger.debug("update started")
-        if self.w.enabled:
-            self.w.loading_lb.setVisible(True)
-            online_stat = self.w.device.is_online()
-            self.logger.debug(f"online_stat (ms): {online_stat}")
-            self.w.loading_lb.setVisible(False)
-        else:
-            self.w.device.trigger_count = 0
-        self.logger.debug("update finished")
+    device_started = pyqtSignal(object)
+    device_probed = pyqtSignal(object)
 
 
 class PlayAudioThread(QThread):
@@ -274,6 +263,7 @@ class PlayAudioThread(QThread):
             if platform.system().lower() == 'windows':
                 winsound.PlaySound(snd_path, winsound.SND_FILENAME)
             else:
+                from playsound import playsound
                 playsound(snd_path)
         except Exception as e:
             self.logger.error(e)
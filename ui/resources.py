@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from PyQt5 import uic
+from PyQt5.QtGui import QIcon, QMovie, QPixmap
+
+ICONS_DIR = "./res/icons"
+
+# Process-wide caches, Qt objects are created on first use (after QApplication)
+_forms = {}  # .ui path: compiled form class
+_pixmaps = {}  # file name: QPixmap
+_icons = {}  # file name: QIcon
+_movies = {}  # file name: QMovie
+
+
+def load_ui(path, widget):
+    """
+    uic.loadUi() replacement: .ui XML is parsed and compiled to a form class once,
+    next widgets of this form only run its setupUi()
+    :return: widget
+    """
+    form = _forms.get(path)
+    if form is None:
+        form, _ = uic.loadUiType(path)
+        _forms[path] = form
+    ui = form()
+    ui.setupUi(widget)
+    # Child widgets are attributes of widget, as loadUi() does
+    for name, value in vars(ui).items():
+        setattr(widget, name, value)
+    return widget
+
+
+def pixmap(name):
+    """
+    :param name: file name in icons dir, e.g. "web.png"
+    :return: shared QPixmap
+    """
+    image = _pixmaps.get(name)
+    if image is None:
+        image = _pixmaps[name] = QPixmap(f"{ICONS_DIR}/{name}")
+    return image
+
+
+def icon(name):
+    """
+    :return: shared QIcon of icons dir file
+    """
+    ico = _icons.get(name)
+    if ico is None:
+        ico = _icons[name] = QIcon(pixmap(name))
+    return ico
+
+
+def movie(name):
+    """
+    :return: shared QMovie (one animation for all users), not started
+    """
+    animation = _movies.get(name)
+    if animation is None:
+        animation = _movies[name] = QMovie(f"{ICONS_DIR}/{name}")
+    return animation
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from PyQt5.QtCore import QObject, Qt, QBuffer, QByteArray, QIODevice, pyqtSignal
+from PyQt5.QtGui import QImage, QPixmap
+from ui import resources
+from settings import Settings, SNAPSHOT_INTERVAL
+from span_profile import profiled
+
+SNAPSHOT_WORKERS = 4
+SNAPSHOT_TIMEOUT = 5  # seconds
+# Max count of cached previews
+CACHE_SIZE = 256
+# Tooltip preview size, relative to preview label
+TOOLTIP_SCALE = 6
+TOOLTIP_JPEG_QUALITY = 85
+
+
+class SnapshotLoader(QObject):
+    """
+    Downloads and decodes ONVIF camera snapshots in a worker pool.
+    Decoded previews (label pixmap and tooltip) are kept in a bounded LRU cache.
+    """
+    loaded = pyqtSignal(str, QImage, str)
+
+    # Singleton
+    def __new__(cls, *args):
+        if not hasattr(cls, 'instance'):
+            cls.instance = super(SnapshotLoader, cls).__new__(cls)
+        return cls.instance
+
+    def __init__(self):
+        # hasattr() is not allowed before QObject initialized
+        if 'cache' in self.__dict__:
+            return
+        super().__init__()
+        self.logger = logging.getLogger('SnapshotLoader')
+        self.interval = Settings().snapshot.snapshot_interval
+        Settings().subscribe(self._settings_changed)
+        self.cache = OrderedDict()  # key: (QPixmap, tooltip)
+        self.requested = {}  # key: last request time
+        self.callbacks = {}  # key: callback(pixmap, tooltip) for requests in flight
+        self.executor = ThreadPoolExecutor(max_workers=SNAPSHOT_WORKERS, thread_name_prefix="Snapshot")
+        # Created on the first snapshot request
+        self.session = None
+        self.loaded.connect(self._loaded)
+
+    def _settings_changed(self, general, changed):
+        if SNAPSHOT_INTERVAL in changed:
+            self.interval = general.snapshot_interval
+
+    @staticmethod
+    def _create_session():
+        # requests is loaded on the first snapshot
+        import requests
+        from requests.adapters import HTTPAdapter
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=CACHE_SIZE, pool_maxsize=SNAPSHOT_WORKERS)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    @staticmethod
+    def key(device):
+        """
+        Cameras on one ip with different ports have own previews (watchers differing by watch_for share it)
+        """
+        return str(device)
+
+    def get(self, device):
+        """
+        :return: cached (QPixmap, tooltip) or None
+        """
+        key = self.key(device)
+        preview = self.cache.get(key)
+        if preview is not None:
+            self.cache.move_to_end(key)
+        return preview
+
+    def request(self, device, width, height, callback):
+        """
+        Fetch new snapshot if device snapshot interval elapsed
+        :param width, height: preview label size
+        :param callback: callback(pixmap, tooltip), invoked in GUI thread
+        """
+        key = self.key(device)
+        if key in self.callbacks:
+            self.callbacks[key] = callback
+            return
+        if key in self.cache and time.monotonic() - self.requested.get(key, 0) < self.interval:
+            return
+        self.requested[key] = time.monotonic()
+        self.callbacks[key] = callback
+        if self.session is None:
+            self.session = self._create_session()
+        self.executor.submit(self._fetch, key, device, width, height)
+
+    @profiled("snapshot", subject=2)
+    def _fetch(self, key, device, width, height):
+        """
+        Worker thread: download, decode and scale snapshot
+        """
+        image = QImage()
+        tooltip = ""
+        try:
+            url = device.get_onvif_snapshot()
+            if url is not None:
+                res = self.session.get(url, auth=(device.user, device.password),
+                                       timeout=SNAPSHOT_TIMEOUT)
+                if res.status_code == 200 and image.loadFromData(res.content):
+                    self.logger.debug(f"{device}: snapshot downloaded OK, size: {len(res.content) // 1024} Kb")
+                    tooltip = self._tooltip(image.scaled(width * TOOLTIP_SCALE, height * TOOLTIP_SCALE,
+                                                         Qt.KeepAspectRatio, Qt.SmoothTransformation))
+                    image = image.scaled(width, height, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        except Exception as e:
+            self.logger.error(f"{device}: {e}")
+            image = QImage()
+        self.loaded.emit(key, image, tooltip)
+
+    @staticmethod
+    def _tooltip(image):
+        """
+        :return: tooltip html with embedded JPEG
+        """
+        data = QByteArray()
+        buffer = QBuffer(data)
+        buffer.open(QIODevice.WriteOnly)
+        image.save(buffer, "JPEG", TOOLTIP_JPEG_QUALITY)
+        buffer.close()
+        return f"<img src='data:image/jpeg;base64,{bytes(data.toBase64()).decode()}'></img>"
+
+    def _loaded(self, key, image, tooltip):
+        """
+        GUI thread: cache preview and invoke callback
+        """
+        if image.isNull():
+            pixmap = resources.pixmap("no-image.png")
+            tooltip = None
+        else:
+            pixmap = QPixmap.fromImage(image)
+        self.cache[key] = (pixmap, tooltip)
+        self.cache.move_to_end(key)
+        while len(self.cache) > CACHE_SIZE:
+            old_key, _ = self.cache.popitem(last=False)
+            self.requested.pop(old_key, None)
+        callback = self.callbacks.pop(key, None)
+        if callback is not None:
+            callback(pixmap, tooltip)
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from PyQt5.QtCore import Qt, QEvent, QRect, QRectF, QSize, pyqtSignal
+from PyQt5.QtGui import QColor, QFont, QPainter, QPen
+from PyQt5.QtWidgets import QStyledItemDelegate, QToolTip
+from watch_manager import WatchManager, WatchMethod
+from ui.snapshot_loader import SnapshotLoader
+from ui.watch_model import WatcherRole
+from ui import resources
+from span_profile import profiled
+
+# Watcher row geometry
+ITEM_SIZE = QSize(480, 140)
+TITLE_RECT = QRect(10, 10, 381, 21)
+INFO_RECT = QRect(10, 30, 341, 81)
+STATUS_RECT = QRect(10, 110, 341, 21)
+PREVIEW_RECT = QRect(360, 40, 111, 81)
+SWITCH_RECT = QRect(400, 10, 41, 21)
+DELETE_RECT = QRect(450, 10, 25, 25)
+LOADING_RECT = QRect(430, 120, 41, 16)
+
+BACKGROUND = QColor(206, 220, 224)
+BACKGROUND_DISABLED = QColor(200, 200, 200)
+BORDER = QColor(190, 190, 190)
+TEXT = QColor(0, 0, 0)
+TEXT_DISABLED = QColor(120, 120, 120)
+ONLINE = QColor(0, 161, 13)
+OFFLINE = QColor(255, 0, 0)
+
+
+class WatchDelegate(QStyledItemDelegate):
+    """
+    Paints watcher rows of WatchListModel, only visible rows are painted.
+    Pixmaps and fonts are shared by all rows.
+    """
+    toggled = pyqtSignal(object)  # Watcher on/off switch clicked
+    delete_requested = pyqtSignal(object)  # Watcher delete button clicked
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pixmaps = {name: resources.pixmap(f"{name}.png") for name in
+                        ("switch-on", "switch-off", "web", "weboff", "alert", "delete")}
+        self.title_font = QFont()
+        self.title_font.setPointSize(14)
+        self.info_font = QFont()
+        self.info_font.setPointSize(10)
+        self.status_font = QFont(self.title_font)
+        self.status_bold_font = QFont(self.title_font)
+        self.status_bold_font.setBold(True)
+        self.scaled = {}  # (pixmap cacheKey, width, height): scaled pixmap
+
+    def sizeHint(self, option, index):
+        return ITEM_SIZE
+
+    @profiled("ui paint")
+    def paint(self, painter: QPainter, option, index):
+        w = index.data(WatcherRole)
+        if w is None:
+            return
+        model = index.model()
+        painter.save()
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.translate(option.rect.topLeft())
+
+        # Frame
+        painter.setPen(QPen(BORDER, 2))
+        painter.setBrush(BACKGROUND if w.enabled else BACKGROUND_DISABLED)
+        painter.drawRoundedRect(QRectF(3, 3, ITEM_SIZE.width() - 6, ITEM_SIZE.height() - 6), 10, 10)
+
+        # Title and info
+        title, info = WatchManager.describe(w.device)
+        painter.setPen(TEXT if w.enabled else TEXT_DISABLED)
+        painter.setFont(self.title_font)
+        painter.drawText(TITLE_RECT, Qt.AlignLeft | Qt.AlignVCenter, title)
+        painter.setFont(self.info_font)
+        painter.drawText(INFO_RECT, Qt.AlignLeft | Qt.AlignVCenter | Qt.TextWordWrap, info)
+
+        # Online status, alarmed watcher blinks
+        if not w.enabled:
+            status, color = "Наблюдатель выключен", TEXT_DISABLED
+        elif w.device.online_stat:
+            status, color = "В сети", ONLINE
+        else:
+            status, color = "Не в сети", OFFLINE
+        alarm = w.enabled and w.device.trigger_count >= model.alarm_count
+        painter.setPen(color)
+        painter.setFont(self.status_bold_font if alarm and model.blinked else self.status_font)
+        painter.drawText(STATUS_RECT, Qt.AlignLeft | Qt.AlignVCenter, status)
+
+        # Preview, switch, delete button and loading animation
+        self._draw_centered(painter, PREVIEW_RECT, self._preview(w, model))
+        self._draw_centered(painter, SWITCH_RECT, self.pixmaps["switch-on" if w.enabled else "switch-off"])
+        self._draw_centered(painter, DELETE_RECT.adjusted(2, 2, -3, -3), self.pixmaps["delete"])
+        if id(w.device) in model.loading:
+            self._draw_centered(painter, LOADING_RECT, model.loading_movie.currentPixmap())
+        painter.restore()
+
+    def _preview(self, w, model):
+        """
+        :return: preview pixmap, ONVIF snapshot is requested for visible rows only
+        """
+        if not w.enabled:
+            return self.pixmaps["weboff"]
+        if not w.device.online_stat:
+            return self.pixmaps["alert"]
+        if w.device.watch_method != WatchMethod.ONVIF:
+            return self.pixmaps["web"]
+        loader = SnapshotLoader()
+        device = w.device
+        loader.request(device, PREVIEW_RECT.width(), PREVIEW_RECT.height(),
+                       lambda pixmap, tooltip: model.refresh(device))
+        preview = loader.get(device)
+        return self.pixmaps["web"] if preview is None else preview[0]
+
+    def _draw_centered(self, painter, rect, pixmap):
+        if pixmap.isNull():
+            return
+        if pixmap.width() > rect.width() or pixmap.height() > rect.height():
+            # Icons are scaled once
+            key = (pixmap.cacheKey(), rect.width(), rect.height())
+            scaled = self.scaled.get(key)
+            if scaled is None:
+                scaled = self.scaled[key] = pixmap.scaled(rect.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation)
+            pixmap = scaled
+        painter.drawPixmap(rect.x() + (rect.width() - pixmap.width()) // 2,
+                           rect.y() + (rect.height() - pixmap.height()) // 2, pixmap)
+
+    def editorEvent(self, event, model, option, index):
+        if event.type() == QEvent.MouseButtonRelease and event.button() == Qt.LeftButton:
+            pos = event.pos() - option.rect.topLeft()
+            if SWITCH_RECT.contains(pos):
+                self.toggled.emit(index.data(WatcherRole))
+                return True
+            if DELETE_RECT.contains(pos):
+                self.delete_requested.emit(index.data(WatcherRole))
+                return True
+        return False
+
+    def helpEvent(self, event, view, option, index):
+        if event.type() != QEvent.ToolTip:
+            return super().helpEvent(event, view, option, index)
+        w = index.data(WatcherRole)
+        pos = event.pos() - option.rect.topLeft()
+        tooltip = None
+        if DELETE_RECT.contains(pos):
+            tooltip = "Удалить устройство"
+        elif PREVIEW_RECT.contains(pos) and w is not None and w.enabled and w.device.online_stat:
+            preview = SnapshotLoader().get(w.device)
+            if preview is not None:
+                tooltip = preview[1]
+        if tooltip:
+            QToolTip.showText(event.globalPos(), tooltip, view)
+        else:
+            QToolTip.hideText()
+        return True
+
+
+if __name__ == "__main__":
+    pass
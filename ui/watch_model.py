@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+import itertools
+from bisect import bisect_left
+from PyQt5.QtCore import Qt, QAbstractListModel, QModelIndex, QTimer
+from PyQt5.QtGui import QMovie
+from ui import resources
+from watch_manager import WatchManager
+
+# Watcher object of row
+WatcherRole = Qt.UserRole + 1
+BLINK_INTERVAL = 1000  # ms
+
+
+class WatchListModel(QAbstractListModel):
+    """
+    List model over WatchManager.watchers (the same list object).
+    Rows are painted by WatchDelegate from device state,
+    alarm blinking and loading animation are shared by all rows.
+    Watchers are kept sorted by (rank, seq) keys (see WatchManager.active_rank),
+    seq - order of adding, so row of device is found by bisect
+    and only watchers with changed rank are moved.
+    Only devices with changed Device.version are updated and repainted,
+    devices with changed delay only are moved by update_delays() (slow refresh timer).
+    """
+
+    def __init__(self, w_manager: WatchManager, parent=None):
+        super().__init__(parent)
+        self.logger = logging.getLogger("WatchListModel")
+        self.WM = w_manager
+        self.watchers = w_manager.watchers
+        self.keys = []  # sort keys of rows
+        self.key_of = {}  # id(device): sort key
+        self.counter = itertools.count()
+        self.changed = {}  # id(device): device changed since last update_order()
+        self.versions = {}  # id(device): last seen Device.version
+        self.delayed = {}  # id(device): device checked with the same version since last update_delays()
+        self.alarmed = set()  # id(device) of alarmed enabled watchers
+        self.sorting = True  # False - rank of every watcher is 0 (order of adding)
+        self.loading = set()  # id(device) of devices in check
+        self.alarm_count = self._read_alarm_count()
+        self.blinked = False
+        self.blink_timer = QTimer(self)
+        self.blink_timer.setInterval(BLINK_INTERVAL)
+        self.blink_timer.timeout.connect(self._blink)
+        self.blink_timer.start()
+        self.loading_movie = resources.movie("loading.gif")
+        self.loading_movie.frameChanged.connect(self._loading_frame)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.watchers)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self.watchers):
+            return None
+        w = self.watchers[index.row()]
+        if role == WatcherRole:
+            return w
+        if role == Qt.DisplayRole:
+            return WatchManager.describe(w.device)[0]
+        return None
+
+    def contains(self, device):
+        """
+        :return: False if device watcher removed (its check result may arrive after removal)
+        """
+        return id(device) in self.key_of
+
+    def row_of(self, device):
+        """
+        :return: row of device or None
+        """
+        key = self.key_of.get(id(device))
+        return None if key is None else bisect_left(self.keys, key)
+
+    def index_of(self, device):
+        """
+        :return: QModelIndex of device row (invalid if not in list)
+        """
+        row = self.row_of(device)
+        return QModelIndex() if row is None else self.index(row)
+
+    def refresh(self, device):
+        """
+        Repaint device row
+        """
+        index = self.index_of(device)
+        if index.isValid():
+            self.dataChanged.emit(index, index)
+
+    def load(self, watchers):
+        """
+        Add all watchers at once (config loading)
+        """
+        self.beginResetModel()
+        for w in watchers:
+            self.WM.add_watch(w, rebuild=False)
+            self.key_of[id(w.device)] = self._key(w.device, next(self.counter))
+        self._sort()
+        self.endResetModel()
+
+    def add(self, w):
+        key = self._key(w.device, next(self.counter))
+        row = bisect_left(self.keys, key)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.WM.add_watch(w, rebuild=False, index=row)
+        self.keys.insert(row, key)
+        self.key_of[id(w.device)] = key
+        self.endInsertRows()
+
+    def remove(self, w):
+        row = self.row_of(w.device)
+        if row is None:
+            return
+        self.beginRemoveRows(QModelIndex(), row, row)
+        self.WM.del_watch(w)
+        del self.keys[row]
+        self.key_of.pop(id(w.device), None)
+        self.changed.pop(id(w.device), None)
+        self.versions.pop(id(w.device), None)
+        self.delayed.pop(id(w.device), None)
+        self.alarmed.discard(id(w.device))
+        self.loading.discard(id(w.device))
+        self.endRemoveRows()
+
+    def set_enabled(self, w, enabled):
+        self.WM.enable(w, enabled)
+        self.mark_changed(w.device)
+        self.refresh(w.device)
+
+    def mark_changed(self, device):
+        """
+        Device checked, if its state changed row is updated by next update_order(),
+        else its delay may be changed, row is moved by next update_delays()
+        :return: True if device state changed
+        """
+        if not self.contains(device):
+            return False
+        if self.versions.get(id(device)) == device.version:
+            self.delayed[id(device)] = device
+            return False
+        self.versions[id(device)] = device.version
+        self.changed[id(device)] = device
+        self.delayed.pop(id(device), None)
+        return True
+
+    def set_loading(self, device, loading):
+        """
+        Show / hide loading animation of device
+        """
+        if loading:
+            self.loading.add(id(device))
+        else:
+            self.loading.discard(id(device))
+        # Animation runs only while any device is in check
+        if len(self.loading) > 0:
+            if self.loading_movie.state() != QMovie.Running:
+                self.loading_movie.start()
+        else:
+            self.loading_movie.stop()
+        self.refresh(device)
+
+    def update_order(self, sorting):
+        """
+        Move and repaint rows of changed devices, all rows are sorted again
+        if sorting or alarm count setting changed
+        :param sorting: sort by WatchManager.active_rank, False - order of adding
+        :return: list of updated devices
+        """
+        alarm_count = self._read_alarm_count()
+        if sorting != self.sorting or alarm_count != self.alarm_count:
+            self.sorting = sorting
+            self.alarm_count = alarm_count
+            self.changed.clear()
+            self.delayed.clear()
+            self._resort()
+            devices = [w.device for w in self.watchers]
+            self.alarmed.clear()
+        else:
+            devices = list(self.changed.values())
+            self.changed.clear()
+            for device in devices:
+                old = self.key_of.get(id(device))
+                if old is not None:
+                    self._move(device, old, self._key(device, old[1]))
+                    self.refresh(device)
+        for device in devices:
+            if self.contains(device) and device.watched and device.trigger_count >= self.alarm_count:
+                self.alarmed.add(id(device))
+            else:
+                self.alarmed.discard(id(device))
+        return devices
+
+    def update_delays(self):
+        """
+        Move rows of devices checked with unchanged state by their new delay (sorting by accessibility time)
+        """
+        devices = list(self.delayed.values())
+        self.delayed.clear()
+        if not self.sorting:
+            return
+        for device in devices:
+            old = self.key_of.get(id(device))
+            if old is not None:
+                self._move(device, old, self._key(device, old[1]))
+
+    def _key(self, device, seq):
+        return WatchManager.active_rank(device, self.alarm_count) if self.sorting else 0, seq
+
+    def _move(self, device, old, new):
+        """
+        Move row of device from old to new sort key position
+        """
+        if new == old:
+            return
+        row = bisect_left(self.keys, old)
+        dest = bisect_left(self.keys, new)
+        if dest == row or dest == row + 1:
+            # Position not changed
+            self.keys[row] = new
+        else:
+            self.beginMoveRows(QModelIndex(), row, row, QModelIndex(), dest)
+            w = self.watchers.pop(row)
+            del self.keys[row]
+            if dest > row:
+                dest -= 1
+            self.watchers.insert(dest, w)
+            self.keys.insert(dest, new)
+            self.endMoveRows()
+        self.key_of[id(device)] = new
+
+    def _sort(self):
+        """
+        Sort watchers by keys of key_of
+        """
+        self.watchers.sort(key=lambda w: self.key_of[id(w.device)])
+        self.keys = [self.key_of[id(w.device)] for w in self.watchers]
+
+    def _resort(self):
+        """
+        Sort all rows by new keys, rows are kept by persistent indexes
+        """
+        self.layoutAboutToBeChanged.emit()
+        old_indexes = self.persistentIndexList()
+        old_watchers = [self.watchers[index.row()] for index in old_indexes]
+        for w in self.watchers:
+            self.key_of[id(w.device)] = self._key(w.device, self.key_of[id(w.device)][1])
+        self._sort()
+        self.changePersistentIndexList(old_indexes, [self.index_of(w.device) for w in old_watchers])
+        self.layoutChanged.emit()
+
+    def _read_alarm_count(self):
+        return self.WM.settings.snapshot.check_count_to_alarm
+
+    def _blink(self):
+        """
+        Shared blink timer: repaint alarmed rows only
+        """
+        self.blinked = not self.blinked
+        for key in self.alarmed:
+            w = self.WM.by_device.get(key)
+            if w is not None:
+                self.refresh(w.device)
+
+    def _loading_frame(self):
+        for key in self.loading:
+            w = self.WM.by_device.get(key)
+            if w is not None:
+                self.refresh(w.device)
+
+
+if __name__ == "__main__":
+    pass
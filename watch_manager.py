@@ -4,9 +4,14 @@
 
 from enum import Enum
 from settings import *
-from ui.list_item import WatchFrame
 from journal_db import JournalDb
+from inventory_db import Inventory
+from latency_history import LatencyHistory
+from latency_stats import LatencyStats
+from metrics import Metrics
+from onvif_probe import OnvifProbePool
 from datetime import datetime
+import threading
 
 
 class WatchMethod(Enum):
@@ -28,78 +33,231 @@ class WatchFor(Enum):
     OFFLINE = 2
 
 
+class Watcher:
+    """
+    Watcher state: watched device, enabled by user, triggered (written to journal)
+    """
+
+    def __init__(self, device):
+        self.device = device
+        self.enabled = bool(device.watched)
+        self.triggered = False
+
+    def __str__(self):
+        return str(self.device)
+
+
 class WatchManager:
-    watchers = []  # WatchFrame objects
+    watchers = []  # Watcher objects
 
-    def __init__(self, main_w):
+    def __init__(self, main_w=None):
+        """
+        :param main_w: MainWin, None in headless mode
+        """
         self.main_w = main_w
         self.logger = logging.getLogger("WatchManager")
         self.settings = Settings()
-        self.journal = JournalDb()
+        self._journal = None
+        self._inventory = None
+        self.history = LatencyHistory()
+        # Watchers by id(device)
+        self.by_device = {}
+        # Watchers by Device.key (duplicates check)
+        self.by_key = {}
+        self.engine = self._create_engine()
+        self._register_metrics()
+
+    def _register_metrics(self):
+        """
+        Values of devices and engine are read on scrape only, metrics endpoint is started if metrics_port set
+        """
+        metrics = Metrics()
+        metrics.gauge("watchers", "Watchers count", function=lambda: len(self.watchers))
+        metrics.gauge("threads", "Threads count", function=threading.active_count)
+        metrics.counter("missed_deadlines_total", "Checks started late or skipped (previous check still running)",
+                        function=lambda: self.engine.missed_deadlines)
+        metrics.gauge("device_up", "Device answered last check (enabled watchers)", ("watcher",),
+                      function=lambda: [((str(w),), int(bool(w.device.online_stat)))
+                                        for w in list(self.watchers) if w.enabled])
+        metrics.gauge("device_rtt_ms", "Delay of the last check, ms", ("watcher",),
+                      function=lambda: [((str(w),), w.device.rtt) for w in list(self.watchers) if w.enabled])
+        metrics.gauge("device_loss_ratio", "Lost checks of the last checks", ("watcher",),
+                      function=lambda: [((str(w),), w.device.stats.loss / 100) for w in list(self.watchers)
+                                        if w.enabled and w.device.stats is not None])
+        if self.settings.snapshot.metrics_port > 0:
+            metrics.start_server(self.settings.snapshot.metrics_port)
+
+    @property
+    def journal(self):
+        """
+        Journal db is opened on the first record
+        """
+        if self._journal is None:
+            self._journal = JournalDb()
+        return self._journal
+
+    @property
+    def inventory(self):
+        """
+        Inventory db is opened on the first use (not used by benchmarks)
+        """
+        if self._inventory is None:
+            self._inventory = Inventory()
+        return self._inventory
+
+    def stop(self):
+        """
+        Stop probe engine, write queued journal records and latency history
+        """
+        self.engine.stop()
+        self.history.close()
+        Metrics().stop_server()
+        if self._journal is not None:
+            self._journal.close()
 
-    def add_watch(self, w):
-        self.watchers.append(w)
-        self.main_w.build_watchers_list()
+    def _create_engine(self):
+        """
+        :return: ProbeEngine, or ShardedProbeEngine if probe_processes > 1
+        """
+        # Imported here: probe engines depend on WatchMethod
+        from probe_engine import ProbeEngine
+        general = self.settings.snapshot
+        if general.probe_processes > 1:
+            from shard_pool import ShardedProbeEngine
+            return ShardedProbeEngine(general.probe_processes, general.probe_concurrency, general.update_timeout)
+        return ProbeEngine(general.probe_concurrency, general.update_timeout)
+
+    def add_watch(self, w, rebuild=True, index=None):
+        """
+        :param index: position in watchers list, None - append
+        """
+        if index is None:
+            self.watchers.append(w)
+        else:
+            self.watchers.insert(index, w)
+        self.by_device[id(w.device)] = w
+        self.by_key[w.device.key] = w
+        w.device.history = self.history.ring(w.device)
+        if w.device.stats is None:
+            w.device.stats = LatencyStats()
+        self.engine.watch(w.device)
+        if rebuild and self.main_w is not None:
+            self.main_w.build_watchers_list()
+
+    def watcher(self, device):
+        """
+        :return: watcher of device or None
+        """
+        return self.by_device.get(id(device))
+
+    def find(self, device):
+        """
+        :return: watcher of device with the same key (method, ip, port, watch_for) or None
+        """
+        return self.by_key.get(device.key)
 
     def del_watch(self, w):
-        self.settings.config.remove_section(str(w.device))
+        self.inventory.remove(w.device.get_config())
+        self.engine.unwatch(w.device)
+        if w.device.watch_method == WatchMethod.ONVIF:
+            OnvifProbePool().close(w.device.ip, w.device.port)
+        self.by_device.pop(id(w.device), None)
+        if self.by_key.get(w.device.key) is w:
+            del self.by_key[w.device.key]
+        # Detached first: a check still in flight does not append to the released ring
+        w.device.history = None
+        self.history.release(w.device)
         self.watchers.remove(w)
-        self.main_w.vLayoutList.removeWidget(w)
-        self.main_w.build_watchers_list()
-        # Remove watcher (widget) from vLayoutList
-        if self.main_w.vLayoutList.count() == 0:
-            self.main_w.vLayoutList.addWidget(self.main_w.emptyLabel)
-
-    def update_info(self, w: WatchFrame):
-        title = f"{str(WatchMethod(w.device.watch_method)).partition('.')[2]} {w.device.ip}"
-        if w.device.watch_method == WatchMethod.PING:
+
+    def enable(self, w, enabled):
+        """
+        Enable / disable watcher, device config is updated in probe engine (checked now)
+        """
+        w.device.watched = enabled
+        w.device.trigger_count = 0
+        if not enabled:
+            w.device.online_stat = 0
+        w.enabled = enabled
+        w.device.version += 1
+        self.inventory.update(w.device.get_config())
+        self.engine.watch(w.device)
+
+    @staticmethod
+    def describe(device):
+        """
+        :return: watcher title and online statistics text
+        """
+        title = f"{str(WatchMethod(device.watch_method)).partition('.')[2]} {device.ip}"
+        if device.watch_method == WatchMethod.PING:
             method_str = f"Использую старый добрый ping (ECHO, ICMP)"
-        elif w.device.watch_method == WatchMethod.PORT:
-            method_str = f"Переодически проверяю TCP порт {str(w.device.port)}"
-        elif w.device.watch_method == WatchMethod.ONVIF:
+        elif device.watch_method == WatchMethod.PORT:
+            method_str = f"Переодически проверяю TCP порт {str(device.port)}"
+        elif device.watch_method == WatchMethod.ONVIF:
             method_str = "Переодически получаю данные по ONVIF протоколу"
         else:
-            method_str = f"Unknown watch method: {w.device.watch_method}"
+            method_str = f"Unknown watch method: {device.watch_method}"
 
-        if w.device.watch_method == WatchMethod.ONVIF:
-            if bool(w.device.online_stat):
+        if device.watch_method == WatchMethod.ONVIF:
+            if bool(device.online_stat):
                 online_statistics = f"{method_str}\n" + \
-                    f"{w.device.online_stat.Manufacturer} {w.device.online_stat.Model}\n" + \
-                    f"FW ver: {w.device.online_stat.FirmwareVersion}"
+                    f"{device.online_stat.Manufacturer} {device.online_stat.Model}\n" + \
+                    f"FW ver: {device.online_stat.FirmwareVersion}"
             else:
                 online_statistics = f"{method_str}\n"
         else:
             online_statistics = f"{method_str}\n" + \
-                f"Время доступа: ~ {w.device.online_stat if bool(w.device.online_stat) else '?'} ms"
-        w.update_info(title, online_statistics)
-        w.update_online_status(w.device.online_stat)
+                f"Время доступа: ~ {device.online_stat if bool(device.online_stat) else '?'} ms"
+        if device.stats is not None and device.stats.checks > 0:
+            online_statistics += "\n" + WatchManager.describe_stats(device.stats.summary())
+        return title, online_statistics
 
-        # Write in journal watcher changed status
-        dev_triggered = (w.device.trigger_count > int(Settings().read(CHECK_COUNT_TO_ALARM)))
+    @staticmethod
+    def describe_stats(summary):
+        """
+        :param summary: LatencyStats.summary()
+        :return: percentiles, jitter and loss text
+        """
+        def ms(value):
+            if value is None:
+                return "?"
+            return f"{value:.1f}" if value < 10 else f"{value:.0f}"
+        return f"p50/p95/p99: {ms(summary['p50'])}/{ms(summary['p95'])}/{ms(summary['p99'])} ms, " \
+               f"джиттер: {ms(summary['jitter'])} ms, потери: {summary['loss']:.0f}%"
+
+    def check_trigger(self, w):
+        """
+        Write in journal watcher changed status
+        :return: True if watcher triggered status changed
+        """
+        changed = False
+        dev_triggered = (w.device.trigger_count > self.settings.snapshot.check_count_to_alarm)
         if (w.triggered ^ dev_triggered) and w.enabled:
             w.triggered = not w.triggered
+            changed = True
             self.logger.info('Watcher online status changed, write to journal...')
             event_timestamp = datetime.utcnow().timestamp()
             online_status = 'Онлайн' if bool(w.device.online_stat) else 'Оффлайн'
             msg = 'Устройство появилось онлайн' if bool(w.device.online_stat) else 'Устройство ушло в оффлайн'
             self.journal.add_record(event_timestamp, str(w.device), online_status, msg)
         self.logger.debug(f"{w.device} online_stat (ms): {w.device.online_stat}")
+        return changed
 
     @staticmethod
-    def sort_by_active(watcher):
+    def active_rank(device, alarm_count):
         """
-        Key function
-        Sorting by online or enabled
+        Sort key of watchers list: alarmed, online (ONVIF first, then by accessibility time),
+        offline, disabled
+        :param alarm_count: CHECK_COUNT_TO_ALARM setting
         """
         # Online watchers, sorted by accessibility time, ONVIF top
-        if bool(watcher.device.online_stat and watcher.device.watched):
-            if watcher.device.watch_method == WatchMethod.ONVIF:
+        if bool(device.online_stat and device.watched):
+            if device.watch_method == WatchMethod.ONVIF:
                 return -1
             else:
-                return int(watcher.device.online_stat) if str(watcher.device.online_stat).isnumeric() else 10000
+                return int(device.online_stat) if str(device.online_stat).isnumeric() else 10000
         # Offline watchers
-        if bool(watcher.device.watched):
-            return 100000 if watcher.device.trigger_count < int(Settings().read(CHECK_COUNT_TO_ALARM)) else -2
+        if bool(device.watched):
+            return 100000 if device.trigger_count < alarm_count else -2
         # Disabled watchers
         return 200000
 